@@ -3,7 +3,7 @@ try:
     from streamlit_javascript import st_javascript
 except Exception:
     st_javascript = None
-import os, hashlib, secrets
+import os, re, hashlib, hmac, secrets, shutil, mimetypes
 import datetime as dt
 import smtplib, ssl
 from email.message import EmailMessage
@@ -13,49 +13,34 @@ from dateutil.relativedelta import relativedelta
 import pandas as pd, numpy as np, streamlit as st
 from streamlit_cookies_manager import CookieManager
 import uuid
+from types import MappingProxyType, SimpleNamespace
 import streamlit.components.v1 as components
+from streamlit.errors import StreamlitAPIException
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Optional HTTP client (for push notifications)
-try:
-    import requests
-except Exception:
-    requests = None
-
-# ML (optional)
-try:
-    from sklearn.model_selection import train_test_split
-    from sklearn.preprocessing import OneHotEncoder
-    from sklearn.compose import ColumnTransformer
-    from sklearn.pipeline import Pipeline
-    from sklearn.metrics import accuracy_score, roc_auc_score, mean_absolute_error
-    from sklearn.linear_model import LogisticRegression
-    from sklearn.ensemble import RandomForestRegressor
-    import joblib
-except Exception:
-    train_test_split = None
-    OneHotEncoder = None
-    ColumnTransformer = None
-    Pipeline = None
-    accuracy_score = None
-    roc_auc_score = None
-    mean_absolute_error = None
-    LogisticRegression = None
-    RandomForestRegressor = None
-    joblib = None
-
 try:
     import psycopg2
     import psycopg2.extras
+    import psycopg2.pool
+
+    class _PgConnection(psycopg2.extensions.connection):
+        # Pooled connections remember which server-side prepared statements they already hold.
+        def __init__(self, *a, **k):
+            super().__init__(*a, **k)
+            self.prepared=set()
 except Exception:
     psycopg2 = None  # type: ignore
 
 import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Database backend selection
 DB_URL = os.getenv('DATABASE_URL') or os.getenv('WORKNEST_DB_URL') or ''
-DB_IS_POSTGRES = bool(DB_URL.strip().lower().startswith(('postgres://','postgresql://')))
+# SQLAlchemy-style URLs (postgresql+psycopg://, postgresql+psycopg2://) name a driver; libpq only wants the scheme.
+DB_URL = re.sub(r'^(postgres(?:ql)?)\+\w+://', r'\1://', DB_URL.strip(), flags=re.I)
+DB_IS_POSTGRES = bool(DB_URL.lower().startswith(('postgres://','postgresql://')))
 # Backwards-compat alias used by older helper functions / branches
 # (Some parts of the app still reference USE_PG; keep it in sync with DB_IS_POSTGRES.)
 USE_PG = DB_IS_POSTGRES
@@ -66,18 +51,44 @@ st.set_page_config(page_title="WorkNest Mini v3.2.4", layout="wide")
 cookies = CookieManager(prefix="worknest")
 TOKEN_SALT = os.environ.get("WORKNEST_TOKEN_SALT") or os.environ.get("SECRET_KEY") or "worknest-mini"
 
+_TOKEN_SALT_BYTES = TOKEN_SALT.encode("utf-8")
+
 def _hash_token(raw: str) -> str:
-    return hashlib.sha256((raw + TOKEN_SALT).encode("utf-8")).hexdigest()
+    # Same digest as sha256(raw + salt), so stored token hashes stay valid; the salt is encoded once.
+    h = hashlib.sha256(raw.encode("utf-8"))
+    h.update(_TOKEN_SALT_BYTES)
+    return h.hexdigest()
 
 def _utcnow_iso() -> str:
     return dt.datetime.utcnow().replace(microsecond=0).isoformat()
 
 def _parse_iso(s: str):
+    if not s: return None
+    try:
+        return dt.datetime.fromisoformat(str(s).strip())
+    except ValueError:
+        pass
     try:
-        return dtparser.parse(s) if s else None
+        return dtparser.parse(s)
     except Exception:
         return None
 
+TOKEN_TOUCH_INTERVAL = dt.timedelta(minutes=5)
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _remember_token_row(token_hash):
+    # Reloads and new tabs re-validate the same cookie; serve the join from memory for a minute.
+    # Any write (logout's token DELETE, a deactivation) clears it via clear_query_cache().
+    # Only the account fields the session needs: password_hash must not sit in a cross-session cache.
+    return fetch_one_dict("""
+        SELECT a.expires_at, a.last_used_at,
+               u.id, u.username, u.staff_id, u.role, u.is_admin, u.is_active, u.must_change_password
+        FROM auth_tokens a
+        JOIN users u ON u.id = a.user_id
+        WHERE a.token_hash = ?
+        LIMIT 1
+    """, (token_hash,))
+
 def try_auto_login_from_cookie():
     """
     If session is empty but a remember_token cookie exists, validate it and restore st.session_state['user'].
@@ -99,18 +110,12 @@ def try_auto_login_from_cookie():
         return False
 
     token_hash = _hash_token(str(raw))
-    row = fetch_df("""
-        SELECT a.expires_at, u.*
-        FROM auth_tokens a
-        JOIN users u ON u.id = a.user_id
-        WHERE a.token_hash = ?
-        LIMIT 1
-    """, (token_hash,))
+    row = _remember_token_row(token_hash)
 
-    if row.empty:
+    if not row:
         return False
 
-    expires_at = _parse_iso(str(row["expires_at"].iloc[0]))
+    expires_at = _parse_iso(str(row["expires_at"]))
     if (expires_at is not None) and (expires_at < dt.datetime.utcnow()):
         # Expired token: cleanup and force login
         try:
@@ -124,15 +129,18 @@ def try_auto_login_from_cookie():
         return False
 
     # User must still be active
-    if int(row["is_active"].iloc[0] if "is_active" in row.columns else 1) != 1:
+    if int(row.get("is_active", 1)) != 1:
         return False
 
-    st.session_state["user"] = dict(row.iloc[0].drop(labels=["expires_at"], errors="ignore"))
-    # Touch last_used_at (best-effort)
-    try:
-        execute("UPDATE auth_tokens SET last_used_at=? WHERE token_hash=?", (_utcnow_iso(), token_hash))
-    except Exception:
-        pass
+    row.pop("expires_at", None)
+    last_used = _parse_iso(str(row.pop("last_used_at", None) or ""))
+    st.session_state["user"] = row
+    # Touch last_used_at (best-effort); a few minutes' precision is plenty, so skip the write otherwise
+    if last_used is None or (dt.datetime.utcnow() - last_used) > TOKEN_TOUCH_INTERVAL:
+        try:
+            execute("UPDATE auth_tokens SET last_used_at=? WHERE token_hash=?", (_utcnow_iso(), token_hash))
+        except Exception:
+            pass
     return True
 
 def clear_remember_cookie_and_token():
@@ -160,123 +168,120 @@ ADMIN_PAGES = ["👥 Staff","📄 Leave Table","⬆️ Import CSVs","🔐 Access
 
 
 
+# Mobile drawer markup. It has to be emitted on every run: Streamlit drops elements a rerun
+# doesn't render, so a once-per-session guard would remove the drawer after the first interaction.
+_DRAWER_CSS = """
+<style>
+/* Drawer behavior only on narrow screens */
+@media (max-width: 900px){
+  [data-testid="stSidebar"]{
+    position: fixed;
+    top: 0;
+    left: 0;
+    height: 100vh;
+    width: 82vw;
+    max-width: 340px;
+    transform: translateX(-105%);
+    transition: transform .25s ease;
+    z-index: 1002;
+  }
+  body.worknest-drawer-open [data-testid="stSidebar"]{
+    transform: translateX(0);
+  }
+  .worknest-drawer-backdrop{
+    display: none;
+    position: fixed;
+    inset: 0;
+    background: rgba(0,0,0,.35);
+    z-index: 1001;
+  }
+  body.worknest-drawer-open .worknest-drawer-backdrop{display:block;}
+  .worknest-drawer-btn{
+    position: fixed;
+    top: 10px;
+    left: 10px;
+    z-index: 1003;
+    border-radius: 10px;
+    padding: 8px 10px;
+    background: rgba(20,20,20,.55);
+    border: 1px solid rgba(255,255,255,.12);
+    color: #fff;
+    font-weight: 700;
+    cursor: pointer;
+    user-select: none;
+  }
+}
+</style>
+"""
+
+# HTML + JS (use components.html so script executes, not printed)
+_DRAWER_HTML = """
+<div class="worknest-drawer-backdrop" id="wn_backdrop"></div>
+<div class="worknest-drawer-btn" id="wn_drawer_btn">☰</div>
+<script>
+(function(){
+  function setOpen(v){
+    document.body.classList.toggle('worknest-drawer-open', !!v);
+  }
+  function isOpen(){
+    return document.body.classList.contains('worknest-drawer-open');
+  }
+
+  window.__wnOpenDrawer = function(){ setOpen(true); };
+  window.__wnCloseDrawer = function(){ setOpen(false); };
+  window.__wnToggleDrawer = function(){ setOpen(!isOpen()); };
+
+  var btn = document.getElementById('wn_drawer_btn');
+  if(btn){
+    btn.addEventListener('click', function(e){
+      e.preventDefault(); window.__wnToggleDrawer();
+    });
+  }
+  var backdrop = document.getElementById('wn_backdrop');
+  if(backdrop){
+    backdrop.addEventListener('click', function(e){
+      e.preventDefault(); window.__wnCloseDrawer();
+    });
+  }
+
+  // Swipe handling: swipe right from left edge opens; swipe left closes
+  var touchStartX=null, touchStartY=null;
+  document.addEventListener('touchstart', function(e){
+    if(!e.touches || !e.touches.length) return;
+    touchStartX=e.touches[0].clientX;
+    touchStartY=e.touches[0].clientY;
+  }, {passive:true});
+
+  document.addEventListener('touchmove', function(e){
+    if(touchStartX===null || !e.touches || !e.touches.length) return;
+    var x=e.touches[0].clientX, y=e.touches[0].clientY;
+    var dx=x-touchStartX, dy=y-touchStartY;
+
+    // Ignore small moves or vertical swipes
+    if(Math.abs(dx) < 35 || Math.abs(dx) < Math.abs(dy)) return;
+
+    // open gesture: start near left edge and swipe right
+    if(!isOpen() && touchStartX < 25 && dx > 60){
+      setOpen(true); touchStartX=null; return;
+    }
+    // close gesture: swipe left when open
+    if(isOpen() && dx < -60){
+      setOpen(false); touchStartX=null; return;
+    }
+  }, {passive:true});
+
+  document.addEventListener('touchend', function(){
+    touchStartX=null; touchStartY=null;
+  }, {passive:true});
+})();
+</script>
+"""
+
 def inject_mobile_drawer():
     """Enable a slide-in/slide-out sidebar drawer on small screens (mobile)."""
     # CSS (inject via markdown with unsafe HTML)
-    st.markdown(
-        """
-        <style>
-        /* Drawer behavior only on narrow screens */
-        @media (max-width: 900px){
-          [data-testid="stSidebar"]{
-            position: fixed;
-            top: 0;
-            left: 0;
-            height: 100vh;
-            width: 82vw;
-            max-width: 340px;
-            transform: translateX(-105%);
-            transition: transform .25s ease;
-            z-index: 1002;
-          }
-          body.worknest-drawer-open [data-testid="stSidebar"]{
-            transform: translateX(0);
-          }
-          .worknest-drawer-backdrop{
-            display: none;
-            position: fixed;
-            inset: 0;
-            background: rgba(0,0,0,.35);
-            z-index: 1001;
-          }
-          body.worknest-drawer-open .worknest-drawer-backdrop{display:block;}
-          .worknest-drawer-btn{
-            position: fixed;
-            top: 10px;
-            left: 10px;
-            z-index: 1003;
-            border-radius: 10px;
-            padding: 8px 10px;
-            background: rgba(20,20,20,.55);
-            border: 1px solid rgba(255,255,255,.12);
-            color: #fff;
-            font-weight: 700;
-            cursor: pointer;
-            user-select: none;
-          }
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-
-    # HTML + JS (use components.html so script executes, not printed)
-    import streamlit.components.v1 as components
-    components.html(
-        """
-        <div class="worknest-drawer-backdrop" id="wn_backdrop"></div>
-        <div class="worknest-drawer-btn" id="wn_drawer_btn">☰</div>
-        <script>
-        (function(){
-          function setOpen(v){
-            document.body.classList.toggle('worknest-drawer-open', !!v);
-          }
-          function isOpen(){
-            return document.body.classList.contains('worknest-drawer-open');
-          }
-
-          window.__wnOpenDrawer = function(){ setOpen(true); };
-          window.__wnCloseDrawer = function(){ setOpen(false); };
-          window.__wnToggleDrawer = function(){ setOpen(!isOpen()); };
-
-          var btn = document.getElementById('wn_drawer_btn');
-          if(btn){
-            btn.addEventListener('click', function(e){
-              e.preventDefault(); window.__wnToggleDrawer();
-            });
-          }
-          var backdrop = document.getElementById('wn_backdrop');
-          if(backdrop){
-            backdrop.addEventListener('click', function(e){
-              e.preventDefault(); window.__wnCloseDrawer();
-            });
-          }
-
-          // Swipe handling: swipe right from left edge opens; swipe left closes
-          var touchStartX=null, touchStartY=null;
-          document.addEventListener('touchstart', function(e){
-            if(!e.touches || !e.touches.length) return;
-            touchStartX=e.touches[0].clientX;
-            touchStartY=e.touches[0].clientY;
-          }, {passive:true});
-
-          document.addEventListener('touchmove', function(e){
-            if(touchStartX===null || !e.touches || !e.touches.length) return;
-            var x=e.touches[0].clientX, y=e.touches[0].clientY;
-            var dx=x-touchStartX, dy=y-touchStartY;
-
-            // Ignore small moves or vertical swipes
-            if(Math.abs(dx) < 35 || Math.abs(dx) < Math.abs(dy)) return;
-
-            // open gesture: start near left edge and swipe right
-            if(!isOpen() && touchStartX < 25 && dx > 60){
-              setOpen(true); touchStartX=null; return;
-            }
-            // close gesture: swipe left when open
-            if(isOpen() && dx < -60){
-              setOpen(false); touchStartX=null; return;
-            }
-          }, {passive:true});
-
-          document.addEventListener('touchend', function(){
-            touchStartX=null; touchStartY=null;
-          }, {passive:true});
-        })();
-        </script>
-        """,
-        height=0,
-        width=0
-    )
+    st.markdown(_DRAWER_CSS, unsafe_allow_html=True)
+    components.html(_DRAWER_HTML, height=0, width=0)
 
 
 
@@ -286,7 +291,7 @@ def safe_parse_date(v):
     s=str(v).strip()
     if not s or s.lower()=="nan": return None
     try:
-        return dtparser.parse(s).date()
+        return parse_iso_date(s)
     except Exception:
         return None
 
@@ -311,23 +316,33 @@ ENV_DATA_DIR=os.getenv("WORKNEST_DATA_DIR","").strip()
 # Prefer Render persistent disk if present. If you mount a disk at /var/data,
 # files written under /var/data will survive redeploys/restarts.
 RENDER_DISK_DIR = "/var/data/worknest_data"
-DEFAULT_LOCAL_DATA = RENDER_DISK_DIR if os.path.isdir("/var/data") else os.path.join(os.getcwd(), "data")
+
+@st.cache_resource(show_spinner=False)
+def _has_render_disk():
+    # Probed once per process, not on every rerun.
+    return os.path.isdir("/var/data")
+
+_HAS_RENDER_DISK = _has_render_disk()
+DEFAULT_LOCAL_DATA = RENDER_DISK_DIR if _HAS_RENDER_DISK else os.path.join(os.getcwd(), "data")
 
 # If the env var points to /tmp (ephemeral on Render), ignore it and use the
 # persistent disk path instead.
 effective_env_dir = ENV_DATA_DIR
-if ENV_DATA_DIR.startswith("/tmp") and os.path.isdir("/var/data"):
+if ENV_DATA_DIR.startswith("/tmp") and _HAS_RENDER_DISK:
     effective_env_dir = ""
 
-DATA_DIR = _first_writable_dir([effective_env_dir, DEFAULT_LOCAL_DATA, os.getcwd()])
-
-DB_PATH=os.getenv('WORKNEST_DB_PATH', os.path.join(DATA_DIR,'worknest.db'))
-UPLOAD_DIR=os.getenv("WORKNEST_UPLOAD_DIR", os.path.join(DATA_DIR,"uploads"))
+@st.cache_resource(show_spinner=False)
+def _storage_paths(candidates):
+    # This module re-executes on every rerun; do the write probe and folder setup once per process.
+    data_dir=_first_writable_dir(candidates)
+    db_path=os.getenv('WORKNEST_DB_PATH', os.path.join(data_dir,'worknest.db'))
+    upload_dir=os.getenv("WORKNEST_UPLOAD_DIR", os.path.join(data_dir,"uploads"))
+    # Ensure persistence paths exist
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    os.makedirs(upload_dir, exist_ok=True)
+    return data_dir, db_path, upload_dir
 
-
-# Ensure persistence paths exist
-os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+DATA_DIR, DB_PATH, UPLOAD_DIR = _storage_paths((effective_env_dir, DEFAULT_LOCAL_DATA, os.getcwd()))
 
 CORE_DOC_CATEGORIES=["architectural","structural","electrical","mechanical","soil_investigation","boq","program_of_work"]
 STAGES=["Substructure","Ground Floor","Typical Floor","Roof","External Works"]
@@ -340,22 +355,78 @@ TEST_TYPES_DISPLAY=[
 RANK_ORDER=["Higher Technical Officer","Senior Technical Officer","Engineer II","Engineer I","Senior Engineer","Principal Engineer","Assistant Chief Engineer","Chief Engineer","Assistant Director"]
 RANK_TO_INDEX={r:i for i,r in enumerate(RANK_ORDER)}
 
+# Spelling variants seen in staff sheets; lookups below are on the stripped, lower-cased form.
+_RANK_ALIASES=MappingProxyType({
+    "Asst. Director":"Assistant Director",
+    "Assistant Dir":"Assistant Director",
+    "Engr I":"Engineer I",
+    "Engr II":"Engineer II",
+    "Engineer 1":"Engineer I",
+    "Engineer 2":"Engineer II",
+})
+_RANK_BY_ALIAS=MappingProxyType({**{r.lower():r for r in RANK_ORDER}, **{k.lower():v for k,v in _RANK_ALIASES.items()}})
+_RANK_INDEX_BY_ALIAS=MappingProxyType({k:RANK_TO_INDEX[v] for k,v in _RANK_BY_ALIAS.items()})
+
 def normalize_rank(r):
     if not r: return None
     r=str(r).strip()
-    aliases={
-        "Asst. Director":"Assistant Director",
-        "Assistant Dir":"Assistant Director",
-        "Engr I":"Engineer I",
-        "Engr II":"Engineer II",
-        "Engineer 1":"Engineer I",
-        "Engineer 2":"Engineer II",
-    }
-    return aliases.get(r, r)
+    return _RANK_BY_ALIAS.get(r.lower(), r)
 
 def rank_index_safe(r):
-    rr=normalize_rank(r)
-    return RANK_TO_INDEX.get(rr, None)
+    return _RANK_INDEX_BY_ALIAS.get(str(r or "").strip().lower())
+
+def normalize_rank_series(s):
+    # Column version of normalize_rank: known spellings -> canonical rank, anything else kept (stripped).
+    s=s.fillna("").astype(str).str.strip()
+    return s.str.lower().map(_RANK_BY_ALIAS).fillna(s)
+
+def rank_index_series(s):
+    # Column version of rank_index_safe; unknown/blank ranks come back as <NA>.
+    return s.fillna("").astype(str).str.strip().str.lower().map(_RANK_INDEX_BY_ALIAS).astype("Int64")
+
+def _pg_maxconn():
+    # Size it to the server's script threads; keep it under the database's connection limit.
+    return max(1, int(os.getenv("WORKNEST_PG_POOL", "25") or 25))
+
+@st.cache_resource(show_spinner=False)
+def _pg_pool():
+    # Streamlit re-runs this script on every interaction, so the pool lives in
+    # cache_resource (one per server process) rather than in a module global.
+    return psycopg2.pool.ThreadedConnectionPool(1, _pg_maxconn(), DB_URL, connection_factory=_PgConnection)
+
+@st.cache_resource(show_spinner=False)
+def _pg_slots():
+    # ThreadedConnectionPool.getconn() raises PoolError once every connection is out instead of waiting.
+    # get_conn takes a slot here first, so a busy server queues for a free connection rather than failing.
+    return threading.BoundedSemaphore(_pg_maxconn())
+
+@st.cache_resource(show_spinner=False)
+def _sql_memo():
+    # Per-SQL-text rewrites (_adapt_query, _pg_write_plan). A module-level lru_cache would be rebuilt on
+    # every rerun, so the memo lives in cache_resource and is shared by all sessions in the process.
+    return {}
+
+def _memo_sql(kind, q, build):
+    memo=_sql_memo()
+    key=(kind, q)
+    hit=memo.get(key)
+    if hit is None:
+        if len(memo) >= 2048:
+            memo.clear()
+        hit=memo[key]=build(q)
+    return hit
+
+@st.cache_resource(show_spinner=False)
+def _sqlite_local():
+    # SQLite: one connection per script-run thread, reused by every query in that rerun.
+    # It is closed when the thread finishes and its locals are dropped.
+    return threading.local()
+
+@st.cache_resource(show_spinner=False)
+def _sqlite_write_lock():
+    # Writers from different script threads queue here instead of contending for SQLite's
+    # file lock; readers never take it, so they keep running under WAL.
+    return threading.Lock()
 
 def get_conn():
     if DB_IS_POSTGRES:
@@ -363,15 +434,52 @@ def get_conn():
             raise RuntimeError("psycopg2 is not installed. Add psycopg2-binary to requirements.txt")
         if not DB_URL:
             raise RuntimeError("DATABASE_URL (or WORKNEST_DB_URL) is not set.")
-        return psycopg2.connect(DB_URL)
-    c=sqlite3.connect(DB_PATH, check_same_thread=False)
-    c.execute("PRAGMA foreign_keys=ON")
+        slots=_pg_slots()
+        slots.acquire()
+        try:
+            return _pg_pool().getconn()
+        except Exception:
+            slots.release()
+            raise
+    loc=_sqlite_local()
+    c=getattr(loc, "conn", None)
+    if c is None:
+        # The connection lives for the whole rerun, so a bigger statement cache means repeated queries skip re-parsing.
+        c=sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=256)
+        # WAL lets readers run alongside a writer; NORMAL sync is safe in WAL mode and skips an fsync per commit.
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "temp_store=MEMORY",
+                       "mmap_size=268435456", "cache_size=-65536", "busy_timeout=5000", "foreign_keys=ON"):
+            c.execute(f"PRAGMA {pragma}")
+        loc.conn=c
     return c
 
+def _release_conn(c):
+    """Give back a connection from get_conn() (pooled on Postgres, thread-shared on SQLite)."""
+    if DB_IS_POSTGRES:
+        try:
+            # End any read transaction left open by fetch_df before the next borrower gets it.
+            if not c.closed:
+                c.rollback()
+        except Exception:
+            pass
+        try:
+            _pg_pool().putconn(c, close=bool(c.closed))
+        except Exception:
+            pass
+        finally:
+            _pg_slots().release()
+        return
+    try:
+        # A failed write leaves the implicit transaction open; don't keep holding the lock.
+        if c.in_transaction:
+            c.rollback()
+    except Exception:
+        pass
+
 
 def _adapt_query(q: str) -> str:
     if DB_IS_POSTGRES:
-        return q.replace("?", "%s")
+        return _memo_sql("adapt", q, lambda q: q.replace("?", "%s"))
     return q
 
 def _exec_script(cur, sql_script: str):
@@ -384,11 +492,101 @@ def _exec_script(cur, sql_script: str):
     for stmt in stmts:
         cur.execute(stmt)
 
+PWD_ITERATIONS = 200_000
+_LEGACY_PWD_SALT = b"worknest_salt_"
+
+def _legacy_pwd_hash(p):
+    # Original scheme (single SHA-256, static salt); still accepted so existing accounts can log in and get upgraded.
+    return hashlib.sha256(_LEGACY_PWD_SALT + str(p).encode("utf-8")).hexdigest()
+
 def hash_pwd(p):
-    return hashlib.sha256(("worknest_salt_"+str(p)).encode("utf-8")).hexdigest()
+    """Salted PBKDF2-SHA256, stored as pbkdf2_sha256$<iterations>$<salt hex>$<hash hex>."""
+    salt=secrets.token_bytes(16)
+    dk=hashlib.pbkdf2_hmac("sha256", str(p).encode("utf-8"), salt, PWD_ITERATIONS)
+    return f"pbkdf2_sha256${PWD_ITERATIONS}${salt.hex()}${dk.hex()}"
+
+def verify_pwd(p, stored):
+    stored=str(stored or "")
+    if stored.startswith("pbkdf2_sha256$"):
+        try:
+            _, iterations, salt, dk = stored.split("$")
+            calc=hashlib.pbkdf2_hmac("sha256", str(p).encode("utf-8"), bytes.fromhex(salt), int(iterations)).hex()
+        except ValueError:
+            return False
+        return hmac.compare_digest(calc, dk)
+    return hmac.compare_digest(stored, _legacy_pwd_hash(p))
+
+def pwd_needs_rehash(stored):
+    return not str(stored or "").startswith(f"pbkdf2_sha256${PWD_ITERATIONS}$")
+
+# Secondary indexes for hot lookups. Plain CREATE INDEX IF NOT EXISTS so the same DDL runs on SQLite and Postgres.
+INDEX_SCHEMA = """
+CREATE INDEX IF NOT EXISTS idx_ta_staff_status ON task_assignments(staff_id, status, task_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_id_due ON tasks(id, due_date, title);
+CREATE INDEX IF NOT EXISTS idx_ta_task ON task_assignments(task_id);
+CREATE INDEX IF NOT EXISTS idx_documents_project_cat ON documents(project_id, category);
+CREATE INDEX IF NOT EXISTS idx_biweekly_project_date ON biweekly_reports(project_id, report_date);
+CREATE INDEX IF NOT EXISTS idx_reminders_sent_day ON reminders_sent(sent_on, assignment_id, reminder_type);
+CREATE INDEX IF NOT EXISTS idx_task_documents_task ON task_documents(task_id);
+CREATE INDEX IF NOT EXISTS idx_leaves_range ON leaves(start_date, end_date, status);
+CREATE INDEX IF NOT EXISTS idx_leaves_staff_start ON leaves(staff_id, start_date);
+CREATE INDEX IF NOT EXISTS idx_buildings_project_name ON buildings(project_id, name);
+CREATE INDEX IF NOT EXISTS idx_documents_project_uploaded ON documents(project_id, uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_test_results_project_uploaded ON test_results(project_id, uploaded_at);
+CREATE INDEX IF NOT EXISTS idx_tasks_project ON tasks(project_id);
+CREATE INDEX IF NOT EXISTS idx_tasks_due ON tasks(due_date);
+CREATE INDEX IF NOT EXISTS idx_project_staff_staff ON project_staff(staff_id, project_id);
+CREATE INDEX IF NOT EXISTS idx_points_staff_source ON points(staff_id, source, points);
+"""
 
-def init_db():
-    c = get_conn()
+# Open, dated task assignments: the rows behind the task alerts. On Postgres this is kept as the
+# user_alerts materialized view (refreshed on task writes); SQLite reads it as an inline subquery.
+# Severity depends on today's date, so it is worked out at read time, not stored.
+ALERT_ROWS_SQL = """
+    SELECT TA.id AS assignment_id, TA.staff_id, T.id AS task_id, T.title, T.project_id,
+           substr(T.due_date,1,10) AS due
+    FROM task_assignments TA
+    JOIN tasks T ON T.id = TA.task_id
+    WHERE COALESCE(TA.status,'')!='Completed' AND COALESCE(T.due_date,'')!=''
+"""
+
+# Date columns readers parse with a fixed "%Y-%m-%d" format instead of dateutil.
+ISO_DATE_COLUMNS = [("tasks","due_date"), ("tasks","date_assigned"), ("projects","start_date"), ("projects","next_due_date"),
+                    ("leaves","start_date"), ("leaves","end_date"), ("biweekly_reports","report_date"),
+                    ("task_assignments","completed_date")]
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+def _normalize_iso_dates():
+    """One-shot rewrite of legacy date strings (e.g. '2024-05-01 00:00:00', '05/01/2024') to plain ISO."""
+    for table, col in ISO_DATE_COLUMNS:
+        try:
+            df=fetch_df(f"SELECT id, {col} AS v FROM {table} WHERE {col} IS NOT NULL")
+        except Exception:
+            continue
+        fixes=[]
+        for rid, v in zip(df["id"], df["v"]):
+            s=str(v).strip()
+            if _ISO_DATE_RE.fullmatch(s): continue
+            try: fixes.append((dtparser.parse(s).date().isoformat(), int(rid)))
+            except Exception: pass
+        if fixes:
+            try: execute_many(f"UPDATE {table} SET {col}=? WHERE id=?", fixes)
+            except Exception: pass
+
+# Columns added after the first release (password flags, upload review workflow).
+# init_db compares these against the one catalog read and only ALTERs what is missing.
+LATE_COLUMNS = {
+    "users": {"must_change_password": "INTEGER DEFAULT 0", "password_changed_at": "TEXT"},
+    "biweekly_reports": {"status": "TEXT DEFAULT 'PENDING'", "reviewed_by_staff_id": "INTEGER", "reviewed_at": "TEXT", "review_note": "TEXT"},
+    "test_results": {"status": "TEXT DEFAULT 'PENDING'", "reviewed_by_staff_id": "INTEGER", "reviewed_at": "TEXT", "review_note": "TEXT"},
+}
+# Uploads from before the review workflow have no status; treat them as approved so history doesn't vanish.
+LATE_BACKFILL = (
+    "UPDATE biweekly_reports SET status='APPROVED' WHERE status IS NULL",
+    "UPDATE test_results SET status='APPROVED' WHERE status IS NULL",
+)
+
+def _create_schema(c):
     cur = c.cursor()
 
     if DB_IS_POSTGRES:
@@ -618,15 +816,12 @@ CREATE TABLE IF NOT EXISTS ml_predictions (
         _exec_script(cur, pg_schema)
 
         # --- Postgres schema migrations (idempotent) ---
+        # One catalog read up front; each migration below only checks a column once.
+        cur.execute("SELECT table_name, column_name FROM information_schema.columns WHERE table_schema='public'")
+        pg_cols = set(cur.fetchall())
+
         def _pg_has_column(table: str, column: str) -> bool:
-            cur.execute(
-                """SELECT 1
-                   FROM information_schema.columns
-                  WHERE table_schema='public' AND table_name=%s AND column_name=%s
-                  LIMIT 1""",
-                (table, column),
-            )
-            return cur.fetchone() is not None
+            return (table, column) in pg_cols
 
         def _pg_add_column(ddl: str):
             try:
@@ -736,6 +931,23 @@ CREATE TABLE IF NOT EXISTS ml_predictions (
         if not _pg_has_column('test_results', 'rejected_reason'):
             _pg_add_column("ALTER TABLE test_results ADD COLUMN rejected_reason TEXT")
 
+        def _pg_try(q: str):
+            # Same tolerance as the SQLite path; the savepoint keeps one failure from aborting the schema transaction.
+            cur.execute("SAVEPOINT sp_worknest_late")
+            try:
+                cur.execute(q)
+            except Exception:
+                cur.execute("ROLLBACK TO SAVEPOINT sp_worknest_late")
+            cur.execute("RELEASE SAVEPOINT sp_worknest_late")
+
+        # IF NOT EXISTS: an earlier migration above may already have added the column in this pass
+        for t, cols in LATE_COLUMNS.items():
+            for col, decl in cols.items():
+                if not _pg_has_column(t, col):
+                    _pg_try(f"ALTER TABLE {t} ADD COLUMN IF NOT EXISTS {col} {decl}")
+        for q in LATE_BACKFILL:
+            _pg_try(q)
+
     else:
         sqlite_schema = """CREATE TABLE IF NOT EXISTS public_holidays (id INTEGER PRIMARY KEY, date TEXT NOT NULL, name TEXT);
 CREATE TABLE IF NOT EXISTS staff (id INTEGER PRIMARY KEY, name TEXT NOT NULL, rank TEXT NOT NULL, email TEXT UNIQUE, phone TEXT, section TEXT, role TEXT, grade TEXT, join_date TEXT, dob TEXT);
@@ -790,23 +1002,30 @@ CREATE TABLE IF NOT EXISTS password_resets (id INTEGER PRIMARY KEY, user_id INTE
 """
         _exec_script(cur, sqlite_schema)
 
-        # SQLite migrations
+        # SQLite migrations: read every table's columns in one pass
+        have = {}
         try:
-            cols = [r[1] for r in cur.execute("PRAGMA table_info(staff)").fetchall()]
+            for t, col in cur.execute("SELECT m.name, p.name FROM sqlite_master m JOIN pragma_table_info(m.name) p WHERE m.type='table'"):
+                have.setdefault(t, set()).add(col)
+        except Exception:
+            pass
+
+        try:
+            cols = have.get("staff", set())
             if "dob" not in cols:
                 cur.execute("ALTER TABLE staff ADD COLUMN dob TEXT")
         except Exception:
             pass
 
         try:
-            cols = [r[1] for r in cur.execute("PRAGMA table_info(biweekly_reports)").fetchall()]
+            cols = have.get("biweekly_reports", set())
             if "uploaded_at" not in cols:
                 cur.execute("ALTER TABLE biweekly_reports ADD COLUMN uploaded_at TEXT")
         except Exception:
             pass
 
         try:
-            cols = [r[1] for r in cur.execute("PRAGMA table_info(users)").fetchall()]
+            cols = have.get("users", set())
             if "role" not in cols:
                 cur.execute("ALTER TABLE users ADD COLUMN role TEXT DEFAULT 'staff'")
             if "is_active" not in cols:
@@ -815,7 +1034,7 @@ CREATE TABLE IF NOT EXISTS password_resets (id INTEGER PRIMARY KEY, user_id INTE
             pass
 
         try:
-            cols = [r[1] for r in cur.execute("PRAGMA table_info(users)").fetchall()]
+            cols = have.get("users", set())
             if "must_change_password" not in cols:
                 cur.execute("ALTER TABLE users ADD COLUMN must_change_password INTEGER DEFAULT 0")
         except Exception:
@@ -824,7 +1043,7 @@ CREATE TABLE IF NOT EXISTS password_resets (id INTEGER PRIMARY KEY, user_id INTE
 
         # projects: next_due_date
         try:
-            cols = [r[1] for r in cur.execute("PRAGMA table_info(projects)").fetchall()]
+            cols = have.get("projects", set())
             if "next_due_date" not in cols:
                 cur.execute("ALTER TABLE projects ADD COLUMN next_due_date TEXT")
         except Exception:
@@ -837,7 +1056,7 @@ CREATE TABLE IF NOT EXISTS password_resets (id INTEGER PRIMARY KEY, user_id INTE
             pass
 
         try:
-            cols = [r[1] for r in cur.execute("PRAGMA table_info(chat_messages)").fetchall()]
+            cols = have.get("chat_messages", set())
             for col, ddl in [
                 ("attachment_path", "ALTER TABLE chat_messages ADD COLUMN attachment_path TEXT"),
                 ("attachment_name", "ALTER TABLE chat_messages ADD COLUMN attachment_name TEXT"),
@@ -849,76 +1068,80 @@ CREATE TABLE IF NOT EXISTS password_resets (id INTEGER PRIMARY KEY, user_id INTE
             pass
 
         try:
-            tcols = [r[1] for r in cur.execute("PRAGMA table_info(tasks)").fetchall()]
+            tcols = have.get("tasks", set())
             if "created_by_staff_id" not in tcols:
                 cur.execute("ALTER TABLE tasks ADD COLUMN created_by_staff_id INTEGER")
         except Exception:
             pass
 
-    c.commit()
-    c.close()
+        for t, cols in LATE_COLUMNS.items():
+            for col, decl in cols.items():
+                if col not in have.get(t, set()):
+                    try: cur.execute(f"ALTER TABLE {t} ADD COLUMN {col} {decl}")
+                    except Exception: pass  # already added by a migration above
+        for q in LATE_BACKFILL:
+            try: cur.execute(q)
+            except Exception: pass
 
+    c.commit()
 
-    # Ensure forward-compatible columns exist (older DBs may not have them yet)
+def init_db():
+    c = get_conn()
     try:
-        if DB_IS_POSTGRES:
-            execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS must_change_password INTEGER DEFAULT 0")
-            execute("ALTER TABLE users ADD COLUMN IF NOT EXISTS password_changed_at TEXT")
-            # Governance: approvals for uploads (reports/tests)
-            execute("ALTER TABLE biweekly_reports ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'PENDING'")
-            execute("ALTER TABLE biweekly_reports ADD COLUMN IF NOT EXISTS reviewed_by_staff_id INTEGER")
-            execute("ALTER TABLE biweekly_reports ADD COLUMN IF NOT EXISTS reviewed_at TEXT")
-            execute("ALTER TABLE biweekly_reports ADD COLUMN IF NOT EXISTS review_note TEXT")
-            execute("ALTER TABLE test_results ADD COLUMN IF NOT EXISTS status TEXT DEFAULT 'PENDING'")
-            execute("ALTER TABLE test_results ADD COLUMN IF NOT EXISTS reviewed_by_staff_id INTEGER")
-            execute("ALTER TABLE test_results ADD COLUMN IF NOT EXISTS reviewed_at TEXT")
-            execute("ALTER TABLE test_results ADD COLUMN IF NOT EXISTS review_note TEXT")
-            # Backfill NULL statuses to APPROVED for legacy rows (so existing history doesn't vanish)
-            execute("UPDATE biweekly_reports SET status='APPROVED' WHERE status IS NULL")
-            execute("UPDATE test_results SET status='APPROVED' WHERE status IS NULL")
+        _create_schema(c)
+    finally:
+        _release_conn(c)
 
-        else:
-            # SQLite: IF NOT EXISTS for columns is not supported; ignore errors
-            try: execute("ALTER TABLE users ADD COLUMN must_change_password INTEGER DEFAULT 0")
-            except Exception: pass
-            try: execute("ALTER TABLE users ADD COLUMN password_changed_at TEXT")
-            except Exception: pass
-            # Governance: approvals for uploads (reports/tests)
-            for q in [
-                "ALTER TABLE biweekly_reports ADD COLUMN status TEXT DEFAULT 'PENDING'",
-                "ALTER TABLE biweekly_reports ADD COLUMN reviewed_by_staff_id INTEGER",
-                "ALTER TABLE biweekly_reports ADD COLUMN reviewed_at TEXT",
-                "ALTER TABLE biweekly_reports ADD COLUMN review_note TEXT",
-                "ALTER TABLE test_results ADD COLUMN status TEXT DEFAULT 'PENDING'",
-                "ALTER TABLE test_results ADD COLUMN reviewed_by_staff_id INTEGER",
-                "ALTER TABLE test_results ADD COLUMN reviewed_at TEXT",
-                "ALTER TABLE test_results ADD COLUMN review_note TEXT",
-            ]:
-                try: execute(q)
-                except Exception: pass
-            try: execute("UPDATE biweekly_reports SET status='APPROVED' WHERE status IS NULL")
-            except Exception: pass
-            try: execute("UPDATE test_results SET status='APPROVED' WHERE status IS NULL")
-            except Exception: pass
+    # Legacy date rewrite runs once per database, not on every boot
+    if get_setting("MIGRATION_ISO_DATES_DONE") != "1":
+        _normalize_iso_dates()
+        set_setting("MIGRATION_ISO_DATES_DONE", "1")
 
-    except Exception:
-        pass
+    # Indexes go last so every column they reference has been migrated in.
+    for q in [s.strip() for s in INDEX_SCHEMA.split(";") if s.strip()]:
+        try: execute(q)
+        except Exception: pass
+    if DB_IS_POSTGRES:
+        for q in [
+            f"CREATE MATERIALIZED VIEW IF NOT EXISTS user_alerts AS {ALERT_ROWS_SQL}",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_user_alerts_pk ON user_alerts(assignment_id)",
+            "CREATE INDEX IF NOT EXISTS idx_user_alerts_staff_due ON user_alerts(staff_id, due)",
+            # chat_messages.created_at only exists in the Postgres schema (SQLite has posted_at)
+            "CREATE INDEX IF NOT EXISTS idx_chat_created ON chat_messages(created_at DESC)",
+            "CREATE INDEX IF NOT EXISTS idx_chat_staff_created ON chat_messages(staff_id, created_at DESC)",
+        ]:
+            try: execute(q)
+            except Exception: pass
 
-    # Bootstrap admin (only if users table is empty)
+    # Bootstrap admin (only if users table is empty), all on one connection
+    c = get_conn()
     try:
-        ucnt = fetch_df("SELECT COUNT(1) AS n FROM users")
-        n = int(ucnt.iloc[0]["n"]) if not ucnt.empty else 0
-        if n == 0:
-            sid = execute(
-                "INSERT INTO staff (name,rank,email,phone,section,role,grade,join_date) VALUES (?,?,?,?,?,?,?,?)",
-                ("Admin", "Assistant Director", "", "", "", "admin", "", ""),
-            )
-            execute(
-                "INSERT INTO users (staff_id,username,password_hash,is_admin,role,is_active) VALUES (?,?,?,?,?,?)",
+        cur = c.cursor()
+        cur.execute("SELECT COUNT(1) FROM users")
+        if int(cur.fetchone()[0]) == 0:
+            staff_q = "INSERT INTO staff (name,rank,email,phone,section,role,grade,join_date) VALUES (?,?,?,?,?,?,?,?)"
+            staff_p = ("Admin", "Assistant Director", "", "", "", "admin", "", "")
+            if DB_IS_POSTGRES:
+                cur.execute(_adapt_query(staff_q) + " RETURNING id", staff_p)
+                sid = cur.fetchone()[0]
+            else:
+                cur.execute(staff_q, staff_p)
+                sid = cur.lastrowid
+            cur.execute(
+                _adapt_query("INSERT INTO users (staff_id,username,password_hash,is_admin,role,is_active) VALUES (?,?,?,?,?,?)"),
                 (sid, "admin", hash_pwd("fcda"), 1, "admin", 1),
             )
+            c.commit()
     except Exception:
         pass
+    finally:
+        _release_conn(c)
+
+@st.cache_resource(show_spinner=False)
+def _init_db_once():
+    """Schema migrations and the admin bootstrap run once per process, not on every rerun."""
+    init_db()
+    return True
 def fetch_df(q, p=()):
     q=_adapt_query(q)
     c=get_conn()
@@ -928,13 +1151,111 @@ def fetch_df(q, p=()):
                 cur.execute(q, p or ())
                 cols=[d[0] for d in (cur.description or [])]
                 rows=cur.fetchall() if cur.description else []
-            return pd.DataFrame(rows, columns=cols)
+            return pd.DataFrame.from_records(rows, columns=cols, coerce_float=False)
         else:
             df=pd.read_sql_query(q, c, params=p)
             return df
     finally:
-        try: c.close()
-        except Exception: pass
+        _release_conn(c)
+
+
+def fetch_df_large(q, p=(), itersize=10_000):
+    """fetch_df for big scans: on Postgres rows stream through a server-side cursor in itersize batches."""
+    if not DB_IS_POSTGRES:
+        return fetch_df(q, p)
+    q=_adapt_query(q)
+    c=get_conn()
+    try:
+        frames=[]
+        with c.cursor(name="wn_scan") as cur:
+            cur.execute(q, p or ())
+            # Pull one batch at a time so only itersize rows sit as tuples at once
+            for batch in iter(lambda: cur.fetchmany(itersize), []):
+                cols=[d[0] for d in cur.description]
+                frames.append(pd.DataFrame.from_records(batch, columns=cols, coerce_float=False))
+            cols=[d[0] for d in (cur.description or [])]
+        if not frames:
+            return pd.DataFrame(columns=cols)
+        return frames[0] if len(frames)==1 else pd.concat(frames, ignore_index=True)
+    finally:
+        _release_conn(c)
+
+
+def db_version():
+    """Cheap change marker: on SQLite the db and -wal file mtimes move on every commit, from any process.
+
+    (PRAGMA data_version is per connection, and connections here are per script thread, so it can't key a shared cache.)
+    """
+    if DB_IS_POSTGRES:
+        return 0
+    v=[]
+    for path in (DB_PATH, DB_PATH+"-wal"):
+        try:
+            v.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            v.append(0)
+    return tuple(v)
+
+@st.cache_data(ttl=60, max_entries=512, show_spinner=False)
+def _fetch_df_versioned(q, p, version):
+    return fetch_df(q, p)
+
+def fetch_df_cached(q, p=()):
+    """fetch_df for read-mostly lookups, shared across reruns/sessions for up to 60s.
+
+    Every execute() clears it, so writes made through the app show up on the next rerun; on SQLite the
+    key also carries db_version(), so writes from other processes (e.g. the reminder worker) do too.
+    """
+    return _fetch_df_versioned(q, tuple(p or ()), db_version())
+
+def clear_query_cache():
+    _fetch_df_versioned.clear()
+    _remember_token_row.clear()
+    load_holidays.clear()
+    reliever_pool.clear()
+    _setting_row.clear()
+    get_alerts_for_users.clear()
+
+def fetch_rows(q, p=()):
+    """Like fetch_df but returns plain row tuples, for small hot-path reads that don't need a DataFrame."""
+    q=_adapt_query(q)
+    c=get_conn()
+    try:
+        cur=c.cursor()
+        cur.execute(q, p or ())
+        return cur.fetchall() if cur.description else []
+    finally:
+        _release_conn(c)
+
+
+def fetch_one_dict(q, p=()):
+    """First row as a {column: value} dict ({} if none), for single-row lookups on the login path."""
+    q=_adapt_query(q)
+    c=get_conn()
+    try:
+        cur=c.cursor()
+        cur.execute(q, p or ())
+        row=cur.fetchone() if cur.description else None
+        return dict(zip([d[0] for d in cur.description], row)) if row else {}
+    finally:
+        _release_conn(c)
+
+
+def fetch_prepared(name, argtypes, sql, p=()):
+    """Postgres only: PREPARE sql (with $1..$n placeholders) once per pooled connection, then EXECUTE it.
+
+    Skips parse/plan on repeat calls. Returns row tuples like fetch_rows.
+    """
+    c=get_conn()
+    try:
+        cur=c.cursor()
+        if name not in c.prepared:
+            cur.execute(f"PREPARE {name} ({argtypes}) AS {sql}")
+            c.prepared.add(name)
+        cur.execute(f"EXECUTE {name} ({','.join(['%s']*len(p))})", p)
+        return cur.fetchall() if cur.description else []
+    finally:
+        _release_conn(c)
 
 
 def safe_parse_date(val, default=None):
@@ -948,10 +1269,48 @@ def safe_parse_date(val, default=None):
     if not s or s.lower() in ("nan", "none", "null"):
         return default
     try:
-        return dtparser.parse(s).date()
+        return parse_iso_date(s)
     except Exception:
         return default
 
+def parse_iso_date(val):
+    """Dates are stored as ISO text: take the fast date.fromisoformat path, dateutil only for legacy values."""
+    s = str(val).strip()
+    try:
+        return date.fromisoformat(s[:10])
+    except ValueError:
+        return dtparser.parse(s).date()
+
+def _pg_insert_or_ignore(q):
+    # Postgres compatibility: SQLite uses INSERT OR IGNORE
+    if q.lower().startswith("insert or ignore"):
+        q = "INSERT" + q[len("INSERT OR IGNORE"):]
+        if " on conflict" not in q.lower():
+            q = q.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
+    return q
+
+_PG_VALUES_RE = re.compile(r"^(insert\s.+?\bvalues\s*)\((\s*%s\s*,)*\s*%s\s*\)", re.I | re.S)
+
+def _pg_executemany(cur, q, rows):
+    """Postgres bulk path: plain INSERT ... VALUES (%s,...) goes through execute_values (many rows per
+    statement, 1000 per round trip); anything else (UPDATE, INSERT ... SELECT) through execute_batch.
+    Upserts stay row-at-a-time too: DO UPDATE can't touch the same row twice within one statement."""
+    q=_pg_insert_or_ignore(q)
+    m=_PG_VALUES_RE.match(q)
+    if m and "do update" not in q.lower():
+        psycopg2.extras.execute_values(cur, m.group(1) + "%s" + q[m.end():], rows, page_size=1000)
+    else:
+        psycopg2.extras.execute_batch(cur, q, rows)
+
+def _build_pg_write_plan(q):
+    q=_pg_insert_or_ignore(q)
+    low=q.lower()
+    return q, low.startswith("insert") and "returning" not in low, "returning" in low
+
+def _pg_write_plan(q):
+    # execute()'s Postgres dispatch depends only on the SQL text: (final sql, try RETURNING id?, has RETURNING)
+    return _memo_sql("write_plan", q, _build_pg_write_plan)
+
 def execute(q, p=()):
     q=_adapt_query(q).strip()
     c=get_conn()
@@ -959,16 +1318,11 @@ def execute(q, p=()):
         if DB_IS_POSTGRES:
             with c:
                 with c.cursor() as cur:
-                    # Postgres compatibility: SQLite uses INSERT OR IGNORE
-                    if q.lower().startswith("insert or ignore"):
-                        q = "INSERT" + q[len("INSERT OR IGNORE"):]
-                        if " on conflict" not in q.lower():
-                            q = q.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
-                    low=q.lower()
+                    q, want_id, returning = _pg_write_plan(q)
 
                     # For INSERTs, we *optionally* try to fetch the new id (common for SERIAL PK tables).
                     # We must use a SAVEPOINT because a failed RETURNING attempt aborts the transaction in Postgres.
-                    if low.startswith("insert") and "returning" not in low:
+                    if want_id:
                         cur.execute("SAVEPOINT sp_worknest_insert")
                         q2=q.rstrip().rstrip(";")+" RETURNING id"
                         try:
@@ -989,18 +1343,49 @@ def execute(q, p=()):
                             return None
 
                     cur.execute(q, p)
-                    if "returning" in low:
+                    if returning:
                         row=cur.fetchone()
                         return int(row[0]) if row else None
                     return None
         else:
-            cur=c.cursor()
-            cur.execute(q, p)
-            c.commit()
-            return cur.lastrowid
+            with _sqlite_write_lock():
+                cur=c.cursor()
+                cur.execute(q, p)
+                c.commit()
+                return cur.lastrowid
     finally:
-        try: c.close()
-        except Exception: pass
+        _release_conn(c)
+        clear_query_cache()
+
+def execute_many(q, rows):
+    """Run one statement for many parameter rows in a single transaction (no ids returned)."""
+    execute_transaction([(q, rows)])
+
+def execute_transaction(steps):
+    """Run (sql, rows) steps in order inside one transaction: everything commits or nothing does."""
+    steps=[(_adapt_query(q).strip(), [tuple(r) for r in rows]) for q, rows in steps]
+    steps=[(q, rows) for q, rows in steps if rows]
+    if not steps:
+        return
+    c=get_conn()
+    try:
+        if DB_IS_POSTGRES:
+            with c:
+                with c.cursor() as cur:
+                    for q, rows in steps:
+                        _pg_executemany(cur, q, rows)
+        else:
+            with _sqlite_write_lock():
+                try:
+                    for q, rows in steps:
+                        c.executemany(q, rows)
+                    c.commit()
+                except Exception:
+                    c.rollback()
+                    raise
+    finally:
+        _release_conn(c)
+        clear_query_cache()
 
 def execute_sql(q, p=()):
     """Backward-compatible alias used by some pages."""
@@ -1187,6 +1572,7 @@ def send_push(external_user_ids, title: str, message: str):
     if not ids:
         return False
     try:
+        import requests  # optional; only needed once push is configured
         r = requests.post(
             "https://onesignal.com/api/v1/notifications",
             headers={
@@ -1221,12 +1607,18 @@ def _staff_emails_for_project(project_id: int):
     except Exception:
         return []
 
+@st.cache_data(ttl=60, show_spinner=False)
+def _setting_row(key:str):
+    # Settings are read on most reruns and almost never change. Writes here clear this via clear_query_cache();
+    # the TTL picks up changes made by other processes (e.g. the reminder worker).
+    return fetch_rows("SELECT value FROM app_settings WHERE key=?", (key,))[:1]
+
 def get_setting(key:str, default:str|None=None)->str|None:
     """Read a setting from DB (app_settings)."""
     try:
-        df = fetch_df("SELECT value FROM app_settings WHERE key=?", (key,))
-        if not df.empty:
-            v = df.iloc[0]["value"]
+        rows = _setting_row(key)
+        if rows:
+            v = rows[0][0]
             return None if v is None else str(v)
     except Exception:
         pass
@@ -1253,7 +1645,7 @@ def _parse_date_safe(s)->dt.date|None:
         s=str(s).strip()
         if not s or s.lower() in ("nan","none","null"):
             return None
-        return dtparser.parse(s).date()
+        return parse_iso_date(s)
     except Exception:
         return None
 
@@ -1262,6 +1654,16 @@ def _parse_date(v):
     """Backwards-compatible alias used by older perf code."""
     return _parse_date_safe(v)
 
+def _date_series(s):
+    """Column version of _parse_date_safe: datetime64 at midnight, NaT where missing/unparseable.
+    Stored dates are ISO, so one fixed-format pass covers nearly every row; the rest go through the scalar parser."""
+    s = s.astype(str).str.strip()
+    out = pd.to_datetime(s.str[:10], format="%Y-%m-%d", errors="coerce")
+    rest = out.isna() & ~s.str.lower().isin(("", "nan", "none", "null", "nat"))
+    if rest.any():
+        out[rest] = pd.to_datetime(s[rest].map(_parse_date_safe), errors="coerce")
+    return out
+
 def _biweekly_start_date()->dt.date:
     # Global org start date; default to next Tuesday from today if not set
     v = get_setting("BIWEEKLY_START_DATE")
@@ -1330,25 +1732,21 @@ def compute_staff_activity_points(staff_id:int)->dict:
                    AND COALESCE(status,'APPROVED')='APPROVED'""",
             proj_ids,
         )
-        # map project->list of dates
-        rmap={}
-        for _,rr in rdf.iterrows():
-            d=_parse_date_safe(rr.get("report_date"))
-            if d:
-                rmap.setdefault(int(rr["project_id"]), []).append(d)
-        # for each project, for each due date up to today, pick first submitted after due-14 days window
+        # project -> sorted report dates; due dates every 14 days from start up to today
+        rd=pd.to_datetime(rdf["report_date"].astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+        rmap={int(pid): np.sort(g.to_numpy(dtype="datetime64[D]"))
+              for pid, g in rd[rd.notna()].groupby(rdf["project_id"][rd.notna()])}
+        dues=np.arange(np.datetime64(start, "D"), np.datetime64(today, "D") + 1, 14)
         for pid in proj_ids:
-            due=start
-            while due <= today:
-                # find report in window [due-13, due+14] (submit can be late up to 14 days for scoring)
-                window_start=due - dt.timedelta(days=13)
-                window_end=due + dt.timedelta(days=14)
-                candidates=[d for d in rmap.get(pid, []) if window_start <= d <= window_end]
-                if candidates:
-                    submitted=min(candidates)
-                    out["report_points"] += _report_points(due, submitted)
-                # if none, 0 points for that cycle
-                due += dt.timedelta(days=14)
+            rdates=rmap.get(pid)
+            if rdates is None or not len(dues):
+                continue
+            # first report in window [due-13, due+14] (submit can be late up to 14 days for scoring)
+            i=np.searchsorted(rdates, dues - 13)
+            submitted=rdates[np.minimum(i, len(rdates) - 1)]
+            hit=(i < len(rdates)) & (submitted <= dues + 14)
+            # if none, 0 points for that cycle
+            out["report_points"] += sum(_report_points(d, sd) for d, sd in zip(dues[hit].tolist(), submitted[hit].tolist()))
 
     # test reports (award to uploader)
     tdf = fetch_df(
@@ -1432,9 +1830,6 @@ def compute_monthly_base_points(month_start: dt.date) -> pd.DataFrame:
     ms = dt.date(month_start.year, month_start.month, 1)
     me = (ms + relativedelta(months=1)) - dt.timedelta(days=1)
 
-    def _d(x):
-        return _parse_date(x) if x is not None else None
-
     staff_df = fetch_df("SELECT id, name, rank, section FROM staff ORDER BY name", ())
     if staff_df.empty:
         return pd.DataFrame(columns=[
@@ -1442,18 +1837,7 @@ def compute_monthly_base_points(month_start: dt.date) -> pd.DataFrame:
             "task_points","report_points","test_points","total"
         ])
 
-    acc = {}
-    for _, r in staff_df.iterrows():
-        sid = int(r["id"])
-        acc[sid] = {
-            "staff_id": sid,
-            "name": r.get("name") or "",
-            "rank": r.get("rank") or "",
-            "section": r.get("section") or "",
-            "task_points": 0,
-            "report_points": 0,
-            "test_points": 0,
-        }
+    lo, hi = pd.Timestamp(ms), pd.Timestamp(me)
 
     # TASKS: our schema tracks completion via task_assignments.status + completed_date (no boolean column).
     # Status is set to "Completed" by the UI when staff mark an assignment done.
@@ -1473,40 +1857,23 @@ def compute_monthly_base_points(month_start: dt.date) -> pd.DataFrame:
         ()
     )
 
-    for _, r in task_rows.iterrows():
-        try:
-            sid = int(r.get("staff_id"))
-        except Exception:
-            continue
-        if sid not in acc:
-            continue
-        cd = _d(r.get("completed_date"))
-        if cd is None or cd < ms or cd > me:
-            continue
-        ad = _d(r.get("date_assigned"))
-        allotted = r.get("days_allotted")
-        try:
-            allotted = int(allotted) if allotted is not None else None
-        except Exception:
-            allotted = None
-
-        days_taken = None
-        if ad is not None:
-            days_taken = (cd - ad).days
-            if days_taken < 0:
-                days_taken = None
+    sid = pd.to_numeric(task_rows["staff_id"], errors="coerce")
+    cd = _date_series(task_rows["completed_date"])
+    ad = _date_series(task_rows["date_assigned"])
+    allotted = np.trunc(pd.to_numeric(task_rows["days_allotted"], errors="coerce"))
+    days_taken = (cd - ad).dt.days
+    days_taken = days_taken.where(days_taken >= 0)
+    pts = np.where(days_taken <= allotted, 3, np.where(days_taken <= np.floor(1.5 * allotted), 2, 1))
+    pts = np.where(allotted.isna() | (allotted <= 0) | days_taken.isna(), 1, pts)
+    keep = (sid.notna() & cd.between(lo, hi)).to_numpy()
+    task_pts = pd.Series(pts[keep]).groupby(sid[keep].astype(int).to_numpy()).sum()
 
-        if allotted is None or allotted <= 0 or days_taken is None:
-            pts = 1
-        else:
-            if days_taken <= allotted:
-                pts = 3
-            elif days_taken <= int(1.5 * allotted):
-                pts = 2
-            else:
-                pts = 1
+    # Postings for the report/test points below, fetched once: each row's points go to every staff posted to its project
+    posted_df = fetch_df("SELECT project_id, staff_id FROM project_staff WHERE project_id IS NOT NULL AND staff_id IS NOT NULL", ()).astype(int)
 
-        acc[sid]["task_points"] += pts
+    def _share(pid, pts):
+        rows = pd.DataFrame({"project_id": pid.astype(int).to_numpy(), "pts": pts})
+        return rows.merge(posted_df, on="project_id").groupby("staff_id")["pts"].sum()
 
     # REPORTS: approved, due date within month; points to all posted staff
     rpt_rows = fetch_df(
@@ -1523,36 +1890,12 @@ def compute_monthly_base_points(month_start: dt.date) -> pd.DataFrame:
         ()
     )
 
-    for _, r in rpt_rows.iterrows():
-        pid = r.get("project_id")
-        due = _d(r.get("report_date"))
-        up = _d(r.get("uploaded_at"))
-        if pid is None or due is None or up is None:
-            continue
-        if due < ms or due > me:
-            continue
-
-        if up <= due:
-            pts = 3
-        elif up <= (due + dt.timedelta(days=7)):
-            pts = 2
-        else:
-            pts = 1
-
-        posted_df = fetch_df(
-            ("SELECT staff_id FROM staff_projects WHERE project_id=?" if not USE_PG else
-             "SELECT staff_id FROM staff_projects WHERE project_id=%s"),
-            (pid,)
-        )
-        if posted_df.empty:
-            continue
-        for sid in posted_df["staff_id"].tolist():
-            try:
-                sid = int(sid)
-            except Exception:
-                continue
-            if sid in acc:
-                acc[sid]["report_points"] += pts
+    pid = pd.to_numeric(rpt_rows["project_id"], errors="coerce")
+    due = _date_series(rpt_rows["report_date"])
+    up = _date_series(rpt_rows["uploaded_at"])
+    pts = np.where(up <= due, 3, np.where(up <= due + pd.Timedelta(days=7), 2, 1))
+    keep = (pid.notna() & up.notna() & due.between(lo, hi)).to_numpy()
+    report_pts = _share(pid[keep], pts[keep])
 
     # TEST RESULTS: approved, submitted within month; points to all posted staff
     test_rows = fetch_df(
@@ -1569,33 +1912,20 @@ def compute_monthly_base_points(month_start: dt.date) -> pd.DataFrame:
         ()
     )
 
-    for _, r in test_rows.iterrows():
-        pid = r.get("project_id")
-        sub = _d(r.get("submitted_at"))
-        if pid is None or sub is None:
-            continue
-        if sub < ms or sub > me:
-            continue
-
-        pts = 3
-        posted_df = fetch_df(
-            ("SELECT staff_id FROM staff_projects WHERE project_id=?" if not USE_PG else
-             "SELECT staff_id FROM staff_projects WHERE project_id=%s"),
-            (pid,)
-        )
-        if posted_df.empty:
-            continue
-        for sid in posted_df["staff_id"].tolist():
-            try:
-                sid = int(sid)
-            except Exception:
-                continue
-            if sid in acc:
-                acc[sid]["test_points"] += pts
-
-    df = pd.DataFrame(list(acc.values()))
-    if df.empty:
-        return df
+    pid = pd.to_numeric(test_rows["project_id"], errors="coerce")
+    keep = (pid.notna() & _date_series(test_rows["submitted_at"]).between(lo, hi)).to_numpy()
+    test_pts = _share(pid[keep], np.full(int(keep.sum()), 3))
+
+    sids = staff_df["id"].astype(int)
+    df = pd.DataFrame({
+        "staff_id": sids,
+        "name": staff_df["name"].fillna(""),
+        "rank": staff_df["rank"].fillna(""),
+        "section": staff_df["section"].fillna(""),
+        "task_points": sids.map(task_pts).fillna(0).astype(int),
+        "report_points": sids.map(report_pts).fillna(0).astype(int),
+        "test_points": sids.map(test_pts).fillna(0).astype(int),
+    })
     df["total"] = df[["task_points","report_points","test_points"]].sum(axis=1)
     df = df.sort_values(
         by=["total","task_points","report_points","test_points","name"],
@@ -1728,35 +2058,51 @@ def create_password_reset_for_user(user_id:int, minutes_valid:int=30)->str:
 
 def consume_password_reset(token:str)->int|None:
     th=_hash_token(token.strip())
-    df=fetch_df("SELECT id, user_id, expires_at, used FROM password_resets WHERE token_hash=? ORDER BY id DESC LIMIT 1", (th,))
-    if df.empty:
+    row=fetch_one_dict("SELECT id, user_id, expires_at, used FROM password_resets WHERE token_hash=? ORDER BY id DESC LIMIT 1", (th,))
+    if not row:
         return None
-    row=df.iloc[0]
     if int(row.get("used") or 0)==1:
         return None
-    exp=_parse_date_safe(row.get("expires_at"))
-    # expires_at has datetime, parse again:
     try:
-        expdt=dtparser.parse(str(row.get("expires_at")))
-        if expdt < dt.datetime.utcnow():
+        expdt=_parse_iso(str(row.get("expires_at")))
+        if expdt is None or expdt < dt.datetime.utcnow():
             return None
     except Exception:
         return None
     execute("UPDATE password_resets SET used=1 WHERE id=?", (int(row["id"]),))
     return int(row["user_id"])
 
-def send_email(to_email:str, subject:str, body:str)->tuple[bool,str]:
-    """Send plain-text email via SMTP. Requires env vars:
-    SMTP_HOST, SMTP_PORT (default 587), SMTP_USER, SMTP_PASSWORD, SMTP_FROM (optional), SMTP_TLS (default 1).
-    """
-    if not to_email:
-        return (False, "missing recipient")
+def _smtp_settings():
     host=os.getenv("SMTP_HOST","").strip()
     port=int(os.getenv("SMTP_PORT","587").strip() or "587")
     user=os.getenv("SMTP_USER","").strip()
     pwd=os.getenv("SMTP_PASSWORD","").strip()
     use_tls=(os.getenv("SMTP_TLS","1").strip() not in ["0","false","False"])
     sender=os.getenv("SMTP_FROM", user).strip() or user
+    return host, port, user, pwd, use_tls, sender
+
+def _open_smtp():
+    """Open and log in one SMTP session (caller closes it). Lets a batch of mails share the handshake."""
+    host, port, user, pwd, use_tls, _ = _smtp_settings()
+    s=smtplib.SMTP(host, port, timeout=20)
+    try:
+        if use_tls:
+            s.ehlo()
+            s.starttls(context=ssl.create_default_context())
+        s.login(user, pwd)
+    except Exception:
+        s.close()
+        raise
+    return s
+
+def send_email(to_email:str, subject:str, body:str, smtp=None)->tuple[bool,str]:
+    """Send plain-text email via SMTP. Requires env vars:
+    SMTP_HOST, SMTP_PORT (default 587), SMTP_USER, SMTP_PASSWORD, SMTP_FROM (optional), SMTP_TLS (default 1).
+    Pass smtp (from _open_smtp) to reuse an open session; otherwise one is opened for this message.
+    """
+    if not to_email:
+        return (False, "missing recipient")
+    host, port, user, pwd, use_tls, sender = _smtp_settings()
     if not (host and user and pwd):
         return (False, "SMTP not configured")
 
@@ -1766,17 +2112,11 @@ def send_email(to_email:str, subject:str, body:str)->tuple[bool,str]:
     msg["Subject"]=subject
     msg.set_content(body)
 
-    ctx=ssl.create_default_context()
     try:
-        if use_tls:
-            with smtplib.SMTP(host, port, timeout=20) as s:
-                s.ehlo()
-                s.starttls(context=ctx)
-                s.login(user, pwd)
-                s.send_message(msg)
+        if smtp is not None:
+            smtp.send_message(msg)
         else:
-            with smtplib.SMTP(host, port, timeout=20) as s:
-                s.login(user, pwd)
+            with _open_smtp() as s:
                 s.send_message(msg)
         return (True, "sent")
     except Exception as e:
@@ -1787,7 +2127,7 @@ def run_task_reminders(today:date|None=None, horizon_days:int=2)->dict:
     if today is None: today=date.today()
     today_s=str(today)
 
-    df=fetch_df("""
+    df=fetch_df_large("""
         SELECT
             ta.id AS assignment_id,
             ta.status,
@@ -1807,63 +2147,82 @@ def run_task_reminders(today:date|None=None, horizon_days:int=2)->dict:
     if df.empty:
         return {"checked":0,"sent":0,"skipped":0,"errors":0}
 
-    sent=skipped=errors=0
-    for _,r in df.iterrows():
-        try:
-            due=dtparser.parse(r["due_date"]).date()
-        except Exception:
-            continue
-        days_to_due=(due - today).days
-        if days_to_due < 0:
-            rtype="overdue"
-        elif days_to_due <= horizon_days:
-            rtype="due_soon"
-        else:
-            continue
+    # Everything already reminded today, fetched once (dedupe per day)
+    done=fetch_df("SELECT assignment_id, reminder_type FROM reminders_sent WHERE sent_on=?", (today_s,))
+    sent_today=set(zip(map(int, done["assignment_id"]), done["reminder_type"]))
+    sent_rows=[]
+
+    # Classify every row at once; only overdue / due-soon rows reach the send loop.
+    due_ts=_date_series(df["due_date"])
+    days=(due_ts - pd.Timestamp(today)).dt.days
+    todo=df.assign(
+        due=due_ts.dt.date,
+        days_to_due=days,
+        rtype=np.select([days < 0, days <= horizon_days], ["overdue", "due_soon"], default=""),
+    )
+    todo=todo[due_ts.notna() & (todo["rtype"]!="")]
 
-        # dedupe per day
-        already=fetch_df("SELECT 1 FROM reminders_sent WHERE assignment_id=? AND reminder_type=? AND sent_on=?",
-                         (int(r["assignment_id"]), rtype, today_s))
-        if not already.empty:
-            continue
+    sent=skipped=errors=0
+    smtp, smtp_tried = None, False  # one SMTP session for the whole batch, opened on first use
+    try:
+        for r in todo.itertuples(index=False):
+            due, days_to_due, rtype = r.due, int(r.days_to_due), r.rtype
+            if (int(r.assignment_id), rtype) in sent_today:
+                continue
 
-        proj=""
-        if pd.notna(r.get("project_code")) and pd.notna(r.get("project_name")):
-            proj=f"{r['project_code']} — {r['project_name']}"
-        elif pd.notna(r.get("project_code")):
-            proj=str(r["project_code"])
-        subj=f"WorkNest: Task reminder ({'OVERDUE' if rtype=='overdue' else 'Due soon'}) — {r['title']}"
-        body_lines=[
-            f"Hello {r['staff_name']},",
-            "",
-            "This is an automated reminder from WorkNest.",
-            "",
-            f"Task: {r['title']}",
-            f"Due date: {due.isoformat()}",
-        ]
-        if proj:
-            body_lines.append(f"Project: {proj}")
-        if rtype=="overdue":
-            body_lines.append(f"Status: OVERDUE by {abs(days_to_due)} day(s)")
-        else:
-            body_lines.append(f"Status: Due in {days_to_due} day(s)")
-        body_lines += [
-            "",
-            "Please log into WorkNest to review the task details and attachments.",
-            "",
-            "— WorkNest"
-        ]
-        ok,msg=send_email(str(r.get("staff_email") or "").strip(), subj, "\n".join(body_lines))
-        if ok:
-            sent += 1
-            execute("INSERT OR IGNORE INTO reminders_sent (assignment_id, reminder_type, sent_on) VALUES (?,?,?)",
-                    (int(r["assignment_id"]), rtype, today_s))
-        else:
-            # We only log as 'sent' if actually sent; otherwise keep it eligible.
-            if msg=="missing recipient" or msg=="SMTP not configured":
-                skipped += 1
+            proj=""
+            if pd.notna(r.project_code) and pd.notna(r.project_name):
+                proj=f"{r.project_code} — {r.project_name}"
+            elif pd.notna(r.project_code):
+                proj=str(r.project_code)
+            subj=f"WorkNest: Task reminder ({'OVERDUE' if rtype=='overdue' else 'Due soon'}) — {r.title}"
+            body_lines=[
+                f"Hello {r.staff_name},",
+                "",
+                "This is an automated reminder from WorkNest.",
+                "",
+                f"Task: {r.title}",
+                f"Due date: {due.isoformat()}",
+            ]
+            if proj:
+                body_lines.append(f"Project: {proj}")
+            if rtype=="overdue":
+                body_lines.append(f"Status: OVERDUE by {abs(days_to_due)} day(s)")
+            else:
+                body_lines.append(f"Status: Due in {days_to_due} day(s)")
+            body_lines += [
+                "",
+                "Please log into WorkNest to review the task details and attachments.",
+                "",
+                "— WorkNest"
+            ]
+            to=str(r.staff_email or "").strip()
+            if to and not smtp_tried and smtp_configured():
+                smtp_tried=True
+                try: smtp=_open_smtp()
+                except Exception: smtp=None  # send_email below opens its own and reports the error
+            ok,msg=send_email(to, subj, "\n".join(body_lines), smtp=smtp)
+            if (not ok) and smtp is not None and msg.startswith("SMTPServerDisconnected"):
+                try: smtp.close()
+                except Exception: pass
+                try: smtp=_open_smtp()
+                except Exception: smtp=None
+                ok,msg=send_email(to, subj, "\n".join(body_lines), smtp=smtp)
+            if ok:
+                sent += 1
+                sent_rows.append((int(r.assignment_id), rtype, today_s))
             else:
-                errors += 1
+                # We only log as 'sent' if actually sent; otherwise keep it eligible.
+                if msg=="missing recipient" or msg=="SMTP not configured":
+                    skipped += 1
+                else:
+                    errors += 1
+    finally:
+        # Record what already went out even if a later send or row blows up, so the next run doesn't resend it
+        if smtp is not None:
+            try: smtp.quit()
+            except Exception: pass
+        execute_many("INSERT OR IGNORE INTO reminders_sent (assignment_id, reminder_type, sent_on) VALUES (?,?,?)", sent_rows)
     return {"checked":int(len(df)),"sent":sent,"skipped":skipped,"errors":errors}
 
 
@@ -1874,16 +2233,27 @@ def apply_styles():
     </style>""", unsafe_allow_html=True)
 
 def current_user(): return st.session_state.get("user")
-def user_role():
+def _role_info():
+    # (role, is_admin) for the logged-in user. Permission gates call this dozens of times per rerun,
+    # so it is resolved once per login and kept in session_state next to the user dict it came from.
     u=current_user()
-    if not u: return None
+    if not u: return (None, False)
+    cached=st.session_state.get("_role")
+    if cached and cached[0] is u:
+        return cached[1], cached[2]
+    flag=int(u.get('is_admin',0) or 0)==1
     r=(u.get('role') or '').strip()
-    if r: return r
-    # Backward compatibility
-    return 'admin' if int(u.get('is_admin',0) or 0)==1 else 'staff'
+    if not r:
+        # Backward compatibility
+        r='admin' if flag else 'staff'
+    st.session_state["_role"]=(u, r, r=='admin' or flag)
+    return r, r=='admin' or flag
+
+def user_role():
+    return _role_info()[0]
 
 def is_admin():
-    return user_role()=='admin' or int((current_user() or {}).get('is_admin',0) or 0)==1
+    return _role_info()[1]
 
 # Future-proof hook: if we later introduce a dedicated "reviewer" role, this is where it plugs in.
 def is_reviewer():
@@ -1938,7 +2308,7 @@ def current_user_id():
 def _get_user_permissions(user_id:int)->dict:
     if user_id is None:
         return {"can_assign_tasks":0,"can_confirm_task_completion":0,"can_upload_project_docs":0}
-    df = fetch_df("SELECT can_assign_tasks, can_confirm_task_completion, can_upload_project_docs FROM user_permissions WHERE user_id=?", (int(user_id),))
+    df = fetch_df_cached("SELECT can_assign_tasks, can_confirm_task_completion, can_upload_project_docs FROM user_permissions WHERE user_id=?", (int(user_id),))
     if df.empty:
         return {"can_assign_tasks":0,"can_confirm_task_completion":0,"can_upload_project_docs":0}
     r = df.iloc[0].to_dict()
@@ -1961,7 +2331,7 @@ def current_staff_section()->str|None:
     sid = current_staff_id()
     if sid is None:
         return None
-    df = fetch_df("SELECT section FROM staff WHERE id=?", (int(sid),))
+    df = fetch_df_cached("SELECT section FROM staff WHERE id=?", (int(sid),))
     if df.empty:
         return None
     sec = df["section"].iloc[0]
@@ -1984,13 +2354,19 @@ def login_ui():
         #  - users.username (stored as email for most staff)
         #  - staff.email
         #  - staff.name
-        u=fetch_df("""SELECT u.* FROM users u
+        u=fetch_one_dict("""SELECT u.* FROM users u
                        LEFT JOIN staff s ON s.id=u.staff_id
                        WHERE LOWER(u.username)=LOWER(?) OR LOWER(COALESCE(s.email,''))=LOWER(?) OR LOWER(COALESCE(s.name,''))=LOWER(?)
                        LIMIT 1""", (u_in, u_in, u_in))
 
-        if (not u.empty) and int(u["is_active"].iloc[0] if "is_active" in u.columns else 1)==1 and u["password_hash"].iloc[0]==hash_pwd(password):
-            st.session_state["user"]=dict(u.iloc[0])
+        if u and int(u.get("is_active", 1))==1 and verify_pwd(password, u["password_hash"]):
+            st.session_state["user"]=u
+            # Upgrade legacy / weaker hashes now that we know the password (best-effort)
+            if pwd_needs_rehash(u["password_hash"]):
+                try:
+                    execute("UPDATE users SET password_hash=? WHERE id=?", (hash_pwd(password), int(u["id"])))
+                except Exception:
+                    pass
             # Optional persistent login (Remember me)
             if remember_me:
                 try:
@@ -2109,18 +2485,90 @@ def save_uploaded_file(uploaded_file, subfolder=""):
     folder=os.path.join(UPLOAD_DIR, subfolder) if subfolder else UPLOAD_DIR
     os.makedirs(folder, exist_ok=True)
     path=os.path.join(folder, fname)
-    with open(path, "wb") as f:
-        f.write(uploaded_file.getbuffer())
+    try: uploaded_file.seek(0)  # copy from the start even if something already read it
+    except Exception: pass
+    with open(path, "wb", buffering=1<<20) as f:
+        shutil.copyfileobj(uploaded_file, f, length=1<<20)
     return path
 
-def file_download_button(label, file_path, key):
+def rerun_fragment():
+    """Rerun just the calling st.fragment; falls back to a full rerun when the fragment is running as part of one."""
     try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+def file_download_button(label, file_path, key):
+    # The file is read only when the button is clicked, not on every render of the listing.
+    if not file_path or not os.path.exists(file_path):
+        st.error(f"Missing file: {file_path}"); return
+    def _read():
         with open(file_path, "rb") as f:
-            data=f.read()
-        st.download_button(label, data=data, file_name=os.path.basename(file_path), key=key)
-    except Exception as e:
+            return f.read()
+    try:
+        st.download_button(label, data=_read, file_name=os.path.basename(file_path),
+                           mime=mimetypes.guess_type(file_path)[0] or "application/octet-stream", key=key)
+    except Exception:
         st.error(f"Missing file: {file_path}")
 
+@st.cache_data(ttl=60, show_spinner=False)
+def get_alerts_for_users(staff_ids, horizon_days=7):
+    """Open tasks that are overdue or due within horizon_days, for several staff at once.
+
+    Returns {staff_id: [(task_id, due, severity, message), ...]}. Overdue/due-soon is decided in SQL
+    (severity 'high' / 'medium') and everyone is covered by one round-trip. Results are cached for 60s;
+    any write clears them via clear_query_cache(), and task writes also call invalidate_alerts().
+    """
+    ids=sorted({int(x) for x in staff_ids if x is not None})
+    out={i: [] for i in ids}
+    if not ids:
+        return out
+    today=date.today()
+    today_s, until_s = today.isoformat(), (today+timedelta(days=horizon_days)).isoformat()
+    rows=None
+    if DB_IS_POSTGRES:
+        try:
+            rows=fetch_prepared("wn_alerts", "integer[], text, text", """
+                SELECT A.staff_id, A.task_id, A.due,
+                       CASE WHEN A.due < $2 THEN 'high' ELSE 'medium' END AS severity,
+                       CASE WHEN COALESCE(TRIM(P.code),'')='' THEN COALESCE(A.title,'')
+                            ELSE TRIM(P.code) || ' — ' || COALESCE(A.title,'') END AS message
+                FROM user_alerts A
+                LEFT JOIN projects P ON P.id = A.project_id
+                WHERE A.staff_id = ANY($1) AND A.due <= $3
+            """, (ids, today_s, until_s))
+        except Exception:
+            rows=None  # view missing (e.g. no privilege to create it): read the live tables below
+    if rows is None:
+        qmarks=",".join(["?"]*len(ids))
+        rows=fetch_rows(f"""
+            SELECT A.staff_id, A.task_id, A.due,
+                   CASE WHEN A.due < ? THEN 'high' ELSE 'medium' END AS severity,
+                   CASE WHEN COALESCE(TRIM(P.code),'')='' THEN COALESCE(A.title,'')
+                        ELSE TRIM(P.code) || ' — ' || COALESCE(A.title,'') END AS message
+            FROM ({ALERT_ROWS_SQL}) A
+            LEFT JOIN projects P ON P.id = A.project_id
+            WHERE A.staff_id IN ({qmarks}) AND A.due <= ?
+        """, (today_s, *ids, until_s))
+    for r in rows:
+        out[r[0]].append(tuple(r[1:]))
+    return out
+
+def refresh_user_alerts():
+    """Bring the user_alerts materialized view up to date after task/assignment writes (Postgres only)."""
+    if not DB_IS_POSTGRES:
+        return
+    try: execute("REFRESH MATERIALIZED VIEW CONCURRENTLY user_alerts")
+    except Exception: pass
+
+def invalidate_alerts():
+    """Call after any task/assignment write so alerts reflect it on the next render."""
+    refresh_user_alerts()
+    get_alerts_for_users.clear()
+
+def get_user_alerts(staff_id, horizon_days=7):
+    return get_alerts_for_users((int(staff_id),), horizon_days).get(int(staff_id), [])
+
 # ---------- Dashboard ----------
 def page_dashboard():
     st.markdown(f"<div class='worknest-header'><h2>🏠 {APP_TITLE} — Dashboard</h2></div>", unsafe_allow_html=True)
@@ -2128,18 +2576,21 @@ def page_dashboard():
     admin=is_admin()
     selected = None  # ensure defined for all branches
     col1,col2,col3=st.columns(3)
-    projects=fetch_df("SELECT * FROM projects")
-    staff=fetch_df("SELECT * FROM staff")
-    open_tasks=fetch_df("SELECT * FROM task_assignments WHERE status!='Completed'")
-    col1.metric("Projects", len(projects))
+    counts=fetch_df_cached("""SELECT (SELECT COUNT(*) FROM projects) AS projects,
+        (SELECT COUNT(*) FROM task_assignments WHERE status!='Completed') AS open_tasks""").iloc[0]
+    staff=fetch_df_cached("SELECT id, name FROM staff")  # also feeds the supervisor picker below
+    col1.metric("Projects", int(counts["projects"]))
     col2.metric("Staff", len(staff))
-    col3.metric("Open Tasks", len(open_tasks))
+    col3.metric("Open Tasks", int(counts["open_tasks"]))
+
+    # One grouped query instead of one query per project.
+    last=fetch_df_cached("SELECT project_id, MAX(COALESCE(uploaded_at, report_date)) AS d FROM biweekly_reports GROUP BY project_id")
+    # Stored dates are ISO, so one fixed-format parse covers them all; junk becomes NaT and the start date is used instead.
+    last_d=pd.to_datetime(last["d"].astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+    last_by_pid={pid: d.date() for pid, d in zip(last["project_id"], last_d) if pd.notna(d)}
 
-    def project_core_docs_status(pid):
-        df=fetch_df("SELECT DISTINCT category FROM documents WHERE project_id=?", (pid, current_staff_id() or -1,))
-        present=set(df["category"]) if not df.empty else set()
-        missing=[c for c in CORE_DOC_CATEGORIES if c not in present]
-        return present, missing
+    def last_report_date(pid):
+        return last_by_pid.get(pid)
 
     def project_next_due(pid, start_date, next_due_date=None):
         # If a next_due_date is set on the project, it becomes the authoritative schedule anchor.
@@ -2148,19 +2599,10 @@ def page_dashboard():
             if next_due_date is not None and not (isinstance(next_due_date, float) and pd.isna(next_due_date)):
                 s = str(next_due_date).strip()
                 if s and s.lower() not in ("nan","none","null"):
-                    nd = dtparser.parse(s).date()
+                    nd = parse_iso_date(s)
             if nd is not None:
-                # Still fetch last submitted report date for context
-                last = fetch_df("SELECT MAX(COALESCE(uploaded_at, report_date)) d FROM biweekly_reports WHERE project_id=?", (pid,))
-                last_d = None
-                try:
-                    if (not last.empty) and ("d" in last.columns):
-                        raw = last["d"].iloc[0]
-                        if raw is not None and str(raw).strip().lower() not in ("", "nan", "none", "null"):
-                            last_d = dtparser.parse(str(raw)).date()
-                except Exception:
-                    last_d = None
-                return (date.today() > nd, last_d, nd, None)
+                # Still report the last submitted report date for context
+                return (date.today() > nd, last_report_date(pid), nd, None)
         except Exception:
             pass
 
@@ -2173,22 +2615,11 @@ def page_dashboard():
             sd = str(start_date).strip()
             if sd == "" or sd.lower() in ("nan", "none", "null"):
                 return (True, None, None, "Start date missing — cannot track biweekly schedule")
-            start = dtparser.parse(sd).date()
+            start = parse_iso_date(sd)
         except Exception:
             return (True, None, None, f"Invalid start date '{start_date}' — cannot track biweekly schedule")
 
-        last = fetch_df("SELECT MAX(COALESCE(uploaded_at, report_date)) d FROM biweekly_reports WHERE project_id=?", (pid,))
-        last_raw = None
-        if (not last.empty) and ("d" in last.columns):
-            last_raw = last["d"].iloc[0]
-
-        last_d = None
-        try:
-            if last_raw is not None and not (isinstance(last_raw, float) and pd.isna(last_raw)) and str(last_raw).strip().lower() not in ("", "nan", "none", "null"):
-                last_d = dtparser.parse(str(last_raw)).date()
-        except Exception:
-            last_d = None  # if stored value is junk, ignore and compute from start date
-
+        last_d = last_report_date(pid)
         exp = (start + timedelta(days=14)) if (last_d is None) else (last_d + timedelta(days=14))
         return (date.today() > exp, last_d, exp, None)
 
@@ -2201,19 +2632,19 @@ def page_dashboard():
 
     # 1) Bi-weekly reports / project outputs due for projects you are posted to
     if admin:
-        proj_due=fetch_df("SELECT id,code,name,start_date,next_due_date FROM projects ORDER BY code")
+        proj_due=fetch_df_cached("SELECT id,code,name,start_date,next_due_date FROM projects ORDER BY code")
     else:
-        proj_due=fetch_df("SELECT P.id,P.code,P.name,P.start_date,P.next_due_date FROM projects P JOIN project_staff PS ON PS.project_id=P.id WHERE PS.staff_id=? ORDER BY P.code", (sid,))
+        proj_due=fetch_df_cached("SELECT P.id,P.code,P.name,P.start_date,P.next_due_date FROM projects P JOIN project_staff PS ON PS.project_id=P.id WHERE PS.staff_id=? ORDER BY P.code", (sid,))
 
-    for _,p in proj_due.iterrows():
-        pid=int(p["id"])
-        overdue,last_d,exp,reason = project_next_due(pid, p.get("start_date"), p.get("next_due_date"))
+    for p in proj_due.itertuples(index=False):
+        pid=int(p.id)
+        overdue,last_d,exp,reason = project_next_due(pid, p.start_date, p.next_due_date)
         if exp is None: continue
         if overdue or (exp - today).days <= 7:
             status = "Overdue" if overdue else "Due soon"
             items.append({
                 "type":"Project report",
-                "item":f"{p.get('code','')} — {p.get('name','')}",
+                "item":f"{p.code} — {p.name}",
                 "due":exp.isoformat(),
                 "status":status,
                 "details":reason
@@ -2221,26 +2652,14 @@ def page_dashboard():
 
     # 2) Tasks due / overdue assigned to you
     if sid is not None:
-        tdf=fetch_df("""
-            SELECT T.id, T.title, T.due_date, TA.status, P.code AS project_code, P.name AS project_name
-            FROM task_assignments TA
-            JOIN tasks T ON T.id = TA.task_id
-            LEFT JOIN projects P ON P.id = T.project_id
-            WHERE TA.staff_id=? AND COALESCE(TA.status,'')!='Completed'
-        """, (sid,))
-        for _,t in tdf.iterrows():
-            due=safe_parse_date(t.get("due_date"))
-            if due is None: continue
-            if due <= horizon:
-                status = "Overdue" if due < today else "Due soon"
-                pfx = (t.get("project_code") or "").strip()
-                items.append({
-                    "type":"Task",
-                    "item":f"{pfx} — {t.get('title','')}" if pfx else str(t.get('title') or ""),
-                    "due":due.isoformat(),
-                    "status":status,
-                    "details":f"Task ID {t.get('id')}"
-                })
+        for task_id, due, sev, msg in get_user_alerts(sid, (horizon - today).days):
+            items.append({
+                "type":"Task",
+                "item":msg,
+                "due":due,
+                "status":"Overdue" if sev=="high" else "Due soon",
+                "details":f"Task ID {task_id}"
+            })
 
     if items:
         df_items=pd.DataFrame(items)
@@ -2253,7 +2672,7 @@ def page_dashboard():
 
     # --- Project Quick Edit (Admin only) ---
     st.markdown("### Project Quick Edit")
-    pdf = fetch_df("SELECT id,code,name,client,location,start_date,end_date,supervisor_staff_id FROM projects ORDER BY code")
+    pdf = fetch_df_cached("SELECT id,code,name,client,location,start_date,end_date,supervisor_staff_id FROM projects ORDER BY code")
     if not pdf.empty:
         options = ["— Select project —"] + [f"{r['code']} — {r['name']}" for _, r in pdf.iterrows()]
         pick = st.selectbox("Project", options, key="dash_proj_pick")
@@ -2587,7 +3006,7 @@ def page_leave():
     st.markdown("<div class='worknest-header'><h2>🧳 Leave</h2></div>", unsafe_allow_html=True)
     staff_df=fetch_df("SELECT id,name,rank FROM staff ORDER BY name")
     hol_df=fetch_df("SELECT date FROM public_holidays")
-    holidays=[dtparser.parse(x).date() for x in hol_df["date"].tolist()] if not hol_df.empty else []
+    holidays=[parse_iso_date(x) for x in hol_df["date"].tolist()] if not hol_df.empty else []
 
     if staff_df.empty:
         st.info("Add staff first."); return
@@ -2649,7 +3068,7 @@ def page_leave():
         for _,L in all_leaves.iterrows():
             if int(L["staff_id"])==int(sid):
                 try:
-                    Ls=dtparser.parse(L["start_date"]).date(); Le=dtparser.parse(L["end_date"]).date()
+                    Ls=parse_iso_date(L["start_date"]); Le=parse_iso_date(L["end_date"])
                 except: continue
                 if (s<=Le and Ls<=e) and (str(L.get("status","Pending"))!="Rejected"):
                     return True
@@ -2660,7 +3079,7 @@ def page_leave():
         for _,L in all_leaves.iterrows():
             if pd.notna(L["relieving_staff_id"]) and int(L["relieving_staff_id"])==int(sid):
                 try:
-                    Ls=dtparser.parse(L["start_date"]).date(); Le=dtparser.parse(L["end_date"]).date()
+                    Ls=parse_iso_date(L["start_date"]); Le=parse_iso_date(L["end_date"])
                 except: continue
                 if (s<=Le and Ls<=e) and (str(L.get("status","Pending"))!="Rejected"):
                     return True
@@ -2810,7 +3229,7 @@ def page_leave_table():
     with c2:
         type_filter = st.selectbox("Filter by type", ["All"] + sorted(df["leave_type"].unique().tolist()), key="lvf2")
     with c3:
-        years = sorted({dtparser.parse(d).year for d in df["start_date"]})
+        years = sorted({parse_iso_date(d).year for d in df["start_date"]})
         year_filter = st.selectbox("Filter by year", ["All"] + [str(y) for y in years], key="lvf3")
     f = df.copy()
     if staff_filter!="All": f = f[f["staff"]==staff_filter]
@@ -2832,7 +3251,7 @@ def page_projects():
     st.markdown("<div class='worknest-header'><h2>🏗️ Projects</h2></div>", unsafe_allow_html=True)
     # For Staff: show posted projects first, then the rest.
     if is_admin() or can_manage_projects():
-        projects=fetch_df("""
+        projects=fetch_df_cached("""
             SELECT p.id, p.code, p.name, p.client, p.location, p.start_date, p.end_date, p.next_due_date, p.supervisor_staff_id,
                    (SELECT name FROM staff s WHERE s.id=p.supervisor_staff_id) supervisor
             FROM projects p
@@ -2840,7 +3259,7 @@ def page_projects():
         """)
     else:
         sid = current_staff_id()
-        projects=fetch_df("""
+        projects=fetch_df_cached("""
             SELECT p.id, p.code, p.name, p.client, p.location, p.start_date, p.end_date, p.next_due_date, p.supervisor_staff_id,
                    (SELECT name FROM staff s WHERE s.id=p.supervisor_staff_id) supervisor,
                    CASE WHEN EXISTS (
@@ -2873,7 +3292,9 @@ def page_projects():
             labels=[f"{r['code']} — {r['name']}" for _,r in projects.iterrows()]
             selected_label=st.selectbox("Select a project", labels, key="proj_select")
             selected=projects.iloc[labels.index(selected_label)] if labels else None
-    with right:
+    # Fragments: typing in the form or working inside a tab reruns only that part, not the whole page.
+    @st.fragment
+    def _project_form():
         st.subheader("Create / Update Project")
         if not can_manage_projects():
             st.info("Only Admin can create/update/delete projects.")
@@ -2882,8 +3303,9 @@ def page_projects():
         # This makes the right-side panel instantly reflect the selected project.
         suffix = f"_{int(selected['id'])}" if selected is not None else "_new"
 
-        staff=fetch_df("SELECT id,name,section FROM staff ORDER BY name")
+        staff=fetch_df_cached("SELECT id,name,section FROM staff ORDER BY name")
         sup_names=["—"]+[s for s in staff["name"].tolist()] if not staff.empty else ["—"]
+        staff_id_by_name=dict(zip(staff["name"][::-1], staff["id"][::-1]))  # first match wins on duplicate names
         code=st.text_input("Code", value=(selected["code"] if selected is not None else ""), key=f"proj_code{suffix}")
         name=st.text_input("Name", value=(selected["name"] if selected is not None else ""), key=f"proj_name{suffix}")
         client=st.text_input("Client", value=(selected["client"] if selected is not None and pd.notna(selected["client"]) else ""), key=f"proj_client{suffix}")
@@ -2897,13 +3319,13 @@ def page_projects():
             if can_manage_projects() and st.button("💾 Save / Update", key=f"proj_save{suffix}"):
                 if selected is None:
                     sup_id=None
-                    if sup_name!="—": sup_id=int(staff[staff["name"]==sup_name]["id"].iloc[0])
+                    if sup_name!="—": sup_id=int(staff_id_by_name[sup_name])
                     execute("""INSERT INTO projects (code,name,client,location,start_date,end_date,supervisor_staff_id)
                                VALUES (?,?,?,?,?,?,?)""", (code,name,client or None,location or None,str(start),str(end),sup_id))
                     st.success("Project created.")
                 else:
                     sup_id=None
-                    if sup_name!="—": sup_id=int(staff[staff["name"]==sup_name]["id"].iloc[0])
+                    if sup_name!="—": sup_id=int(staff_id_by_name[sup_name])
                     execute("""UPDATE projects SET code=?,name=?,client=?,location=?,start_date=?,end_date=?,supervisor_staff_id=? WHERE id=?""",
                             (code,name,client or None,location or None,str(start),str(end),sup_id,int(selected["id"])))
                     st.success("Project updated.")
@@ -2913,10 +3335,13 @@ def page_projects():
                 execute("DELETE FROM projects WHERE id=?", (int(selected["id"]),))
                 st.success("Project deleted."); st.rerun()
 
+    with right:
+        _project_form()
+
     if selected is not None:
         pid=int(selected["id"])
         st.markdown("### Posted Staff")
-        df=fetch_df("""
+        df=fetch_df_cached("""
             SELECT s.name, s.rank, ps.role
             FROM project_staff ps JOIN staff s ON s.id=ps.staff_id
             WHERE ps.project_id=? ORDER BY s.rank, s.name
@@ -2927,8 +3352,9 @@ def page_projects():
         tabs = st.tabs(["🏢 Buildings","📄 Core Docs","🧪 Tests","📝 Biweekly Reports"])
 
         # Buildings
-        with tabs[0]:
-            bdf=fetch_df("SELECT id,name,floors FROM buildings WHERE project_id=? ORDER BY name",(pid,))
+        @st.fragment
+        def _tab_buildings():
+            bdf=fetch_df_cached("SELECT id,name,floors FROM buildings WHERE project_id=? ORDER BY name",(pid,))
             st.subheader("Buildings")
             st.dataframe(bdf if not bdf.empty else pd.DataFrame(columns=["id","name","floors"]), width='stretch')
             st.markdown("**Add / Edit Building**")
@@ -2954,8 +3380,12 @@ def page_projects():
                         execute("DELETE FROM buildings WHERE id=?", (int(brow["id"]),))
                         st.success("Building deleted."); st.rerun()
 
+        with tabs[0]:
+            _tab_buildings()
+
         # Core Documents upload/list
-        with tabs[1]:
+        @st.fragment
+        def _tab_core_docs():
             st.subheader("Core Documents")
             c1,c2=st.columns(2)
             with c1:
@@ -2974,19 +3404,24 @@ def page_projects():
                         st.success("Document uploaded.")
                     else:
                         st.error("Select a file first.")
-            ddf=fetch_df("SELECT id,category,file_path,uploaded_at FROM documents WHERE project_id=? ORDER BY uploaded_at DESC",(pid,))
+            ddf=fetch_df_cached("SELECT id,category,file_path,uploaded_at FROM documents WHERE project_id=? ORDER BY uploaded_at DESC",(pid,))
+            ddf["fname"]=ddf["file_path"].astype(str).str.replace(r".*[\\/]", "", regex=True)  # basename, whole column at once
             if ddf.empty:
                 st.info("No documents yet.")
             else:
-                for _,r in ddf.iterrows():
+                for r in ddf.to_dict("records"):
                     colA,colB=st.columns([3,1])
-                    with colA: st.write(f"**{r['category']}** — {os.path.basename(r['file_path'])}  \n*{r['uploaded_at']}*")
+                    with colA: st.write(f"**{r['category']}** — {r['fname']}  \n*{r['uploaded_at']}*")
                     with colB: file_download_button("⬇️ Download", r["file_path"], key=f"docdl{r['id']}")
 
+        with tabs[1]:
+            _tab_core_docs()
+
         # Tests upload/list
-        with tabs[2]:
+        @st.fragment
+        def _tab_tests():
             st.subheader("Test Results (per building & stage)")
-            bdf=fetch_df("SELECT id,name FROM buildings WHERE project_id=? ORDER BY name",(pid,))
+            bdf=fetch_df_cached("SELECT id,name FROM buildings WHERE project_id=? ORDER BY name",(pid,))
             b_opts = ["— (no specific building) —"] + (bdf["name"].tolist() if not bdf.empty else [])
             b_pick = st.selectbox("Building", b_opts, key="t_building")
             bid = None
@@ -3019,7 +3454,7 @@ def page_projects():
                             st.error("Select a file first.")
 
             # List
-            tdf=fetch_df("""
+            tdf=fetch_df_cached("""
                 SELECT tr.id, b.name AS building, tr.stage, tr.test_type, tr.batch_id, tr.file_path, tr.uploaded_at, COALESCE(tr.status,'APPROVED') AS status
                 FROM test_results tr
                 LEFT JOIN buildings b ON b.id=tr.building_id
@@ -3030,7 +3465,7 @@ def page_projects():
             if tdf.empty:
                 st.info("No tests uploaded yet.")
             else:
-                for _,r in tdf.iterrows():
+                for r in tdf.to_dict("records"):
                     colA,colB,colC=st.columns([3,1,1])
                     bname = r["building"] if pd.notna(r["building"]) else "—"
                     lab = r["test_type"].capitalize()
@@ -3046,12 +3481,12 @@ def page_projects():
                                 if r['status']!='APPROVED' and st.button("✅ Approve", key=f"tapp{r['id']}"):
                                     execute("UPDATE test_results SET status='APPROVED', reviewed_by_staff_id=?, reviewed_at=? WHERE id=?",
                                             (current_staff_id(), datetime.now().isoformat(timespec="seconds"), int(r["id"])))
-                                    st.rerun()
+                                    rerun_fragment()
                             with a2:
                                 if r['status']!='REJECTED' and st.button("✖ Reject", key=f"trej{r['id']}"):
                                     execute("UPDATE test_results SET status='REJECTED', reviewed_by_staff_id=?, reviewed_at=? WHERE id=?",
                                             (current_staff_id(), datetime.now().isoformat(timespec="seconds"), int(r["id"])))
-                                    st.rerun()
+                                    rerun_fragment()
                             with a3:
                                 if st.button("🗑️ Delete", key=f"tdel{r['id']}"):
                                     # remove file too
@@ -3061,10 +3496,14 @@ def page_projects():
                                     except Exception:
                                         pass
                                     execute("DELETE FROM test_results WHERE id=?", (int(r["id"]),))
-                                    st.rerun()
+                                    rerun_fragment()
+
+        with tabs[2]:
+            _tab_tests()
 
         # Biweekly Reports
-        with tabs[3]:
+        @st.fragment
+        def _tab_biweekly():
             st.subheader("Biweekly Reports")
             allowed = can_upload_project_outputs(pid)
             st.markdown(f"Upload permission: <span class='pill'>{'Yes' if allowed else 'No'}</span>", unsafe_allow_html=True)
@@ -3084,32 +3523,27 @@ def page_projects():
                         except Exception:
                             pass
                         st.success("Report uploaded.")
+                        # Uploader + everyone posted to the project, awarded in one batch
                         sid = current_staff_id()
-                        if sid is not None:
-                            try:
-                                execute("INSERT OR IGNORE INTO points (staff_id, source, source_id, points, awarded_at) VALUES (?,?,?,?,?)",
-                                        (int(sid), "biweekly", int(rid), 5, datetime.now().isoformat(timespec="seconds")))
-                            except Exception:
-                                pass
-                        posted = fetch_df("SELECT staff_id FROM project_staff WHERE project_id=?", (pid,))
-                        if not posted.empty:
-                            for _,pr in posted.iterrows():
-                                try:
-                                    execute("INSERT OR IGNORE INTO points (staff_id, source, source_id, points, awarded_at) VALUES (?,?,?,?,?)",
-                                            (int(pr["staff_id"]), "biweekly", int(rid), 5, datetime.now().isoformat(timespec="seconds")))
-                                except Exception:
-                                    pass
+                        posted = fetch_df_cached("SELECT staff_id FROM project_staff WHERE project_id=?", (pid,))
+                        ts = datetime.now().isoformat(timespec="seconds")
+                        rows = [(int(s_id), "biweekly", int(rid), 5, ts) for s_id in ([sid] if sid is not None else []) + posted["staff_id"].tolist()]
+                        try:
+                            execute_many("INSERT OR IGNORE INTO points (staff_id, source, source_id, points, awarded_at) VALUES (?,?,?,?,?)", rows)
+                        except Exception:
+                            pass
                     else:
                         st.error("Select a file first.")
-            rdf=fetch_df("SELECT id,report_date,uploaded_at,file_path, COALESCE(status,'APPROVED') AS status, uploader_staff_id FROM biweekly_reports WHERE project_id=? AND (COALESCE(status,'APPROVED')='APPROVED' OR uploader_staff_id=?) ORDER BY date(COALESCE(uploaded_at,report_date)) DESC",(pid, current_staff_id()))
+            rdf=fetch_df_cached("SELECT id,report_date,uploaded_at,file_path, COALESCE(status,'APPROVED') AS status, uploader_staff_id FROM biweekly_reports WHERE project_id=? AND (COALESCE(status,'APPROVED')='APPROVED' OR uploader_staff_id=?) ORDER BY date(COALESCE(uploaded_at,report_date)) DESC",(pid, current_staff_id()))
+            rdf["fname"]=rdf["file_path"].astype(str).str.replace(r".*[\\/]", "", regex=True)
             if rdf.empty:
                 st.info("No reports yet.")
             else:
-                for _,r in rdf.iterrows():
+                for r in rdf.to_dict("records"):
                     colA,colB,colC = st.columns([3,1,2])
                     sub = r['uploaded_at'] if pd.notna(r.get('uploaded_at')) and str(r.get('uploaded_at')).strip() else r['report_date']
                     with colA:
-                        st.markdown(f"**Period:** {r['report_date']}  \n**Submitted:** {sub}  \n{os.path.basename(r['file_path'])}")
+                        st.markdown(f"**Period:** {r['report_date']}  \n**Submitted:** {sub}  \n{r['fname']}")
                     with colB:
                         file_download_button("⬇️ Download", r["file_path"], key=f"bw{r['id']}")
                     with colC:
@@ -3126,12 +3560,12 @@ def page_projects():
                                             execute("UPDATE projects SET next_due_date=? WHERE id=?", (str(pdue + timedelta(days=14)), int(pid)))
                                     except Exception:
                                         pass
-                                    st.rerun()
+                                    rerun_fragment()
                             with c2:
                                 if r['status']!='REJECTED' and st.button("✖ Reject", key=f"brej{r['id']}"):
                                     execute("UPDATE biweekly_reports SET status='REJECTED', reviewed_by_staff_id=?, reviewed_at=? WHERE id=?",
                                             (current_staff_id(), datetime.now().isoformat(timespec="seconds"), int(r['id'])))
-                                    st.rerun()
+                                    rerun_fragment()
                             with c3:
                                 if st.button("🗑️ Delete", key=f"bdel{r['id']}"):
                                     try:
@@ -3140,11 +3574,15 @@ def page_projects():
                                     except Exception:
                                         pass
                                     execute("DELETE FROM biweekly_reports WHERE id=?", (int(r['id']),))
-                                    st.rerun()
+                                    rerun_fragment()
+
+        with tabs[3]:
+            _tab_biweekly()
+
 # ---------- Staff ----------
 def page_staff():
     st.markdown("<div class='worknest-header'><h2>👥 Staff</h2></div>", unsafe_allow_html=True)
-    staff=fetch_df("SELECT id,name,rank,email,section FROM staff ORDER BY name")
+    staff=fetch_df_cached("SELECT id,name,rank,email,section FROM staff ORDER BY name")
     if staff.empty:
         st.info("No staff yet. Import from CSVs or add directly via DB.")
         return
@@ -3153,7 +3591,7 @@ def page_staff():
     srow=staff[staff["name"]==sel].iloc[0]
     st.markdown(f"**Name:** {srow['name']}  \n**Rank:** {srow['rank']}  \n**Email:** {srow['email'] or '—'}  \n**Section:** {srow['section'] or '—'}")
     st.markdown("**Projects posted on:**")
-    df=fetch_df("""
+    df=fetch_df_cached("""
         SELECT p.code AS project_code, p.name AS project_name, COALESCE(ps.role,'Staff') AS role
         FROM project_staff ps JOIN projects p ON p.id=ps.project_id
         WHERE ps.staff_id=? ORDER BY p.code
@@ -3161,29 +3599,48 @@ def page_staff():
     st.dataframe(df if not df.empty else pd.DataFrame(columns=["project_code","project_name","role"]), width='stretch')
 
 # ---------- Leave ----------
+@st.cache_data(ttl=60, show_spinner=False)
+def load_holidays():
+    """Public holidays, parsed once, as the sorted datetime64[D] array np.busday_* take directly."""
+    d=fetch_df("SELECT date FROM public_holidays")
+    return np.array(sorted({parse_iso_date(x) for x in d["date"]}), dtype="datetime64[D]")
+
+# numpy's busday calendar (Mon-Fri, minus holidays) does the day walking in C.
 def working_days_between(start, end, holidays):
     if end < start: return 0
-    d=start; H=set(holidays); days=0
-    while d<=end:
-        if d.weekday()<5 and d not in H: days+=1
-        d+=timedelta(days=1)
-    return days
+    return int(np.busday_count(start, end+timedelta(days=1), holidays=np.asarray(holidays, dtype="datetime64[D]")))
 
 def add_working_days(start, n, holidays, cap_dec31=True):
+    # start counts as day 1 whatever it is; the rest are the next n-1 working days after it
     if n<=1: return start
-    d=start; count=1; H=set(holidays)
+    d=np.busday_offset(start+timedelta(days=1), n-2, roll="forward", holidays=np.asarray(holidays, dtype="datetime64[D]")).astype(object)
     last=date(start.year,12,31) if cap_dec31 else None
-    while count<n:
-        d+=timedelta(days=1)
-        if last and d>last: return last
-        if d.weekday()<5 and d not in H: count+=1
-    return d
+    return last if (last and d>last) else d
+
+@st.cache_data(ttl=60, show_spinner=False)
+def reliever_pool(applicant_id, applicant_rank, start, end, enforce_nearest):
+    """(pool, on_leave, relieving) for a leave request; keyed on exactly what it depends on, so typing
+    the reason or other unrelated reruns reuse it. Cleared with the query cache on any write."""
+    all_staff=fetch_df("SELECT id,name,rank FROM staff ORDER BY name")
+    # Who is away / already relieving someone during [start, end] (dates are stored ISO, so text compares work)
+    overlap="FROM leaves WHERE start_date<=? AND end_date>=? AND COALESCE(status,'Pending')!='Rejected'"
+    on_leave=frozenset(fetch_df(f"SELECT DISTINCT staff_id AS sid {overlap}", (str(end), str(start)))["sid"].astype(int))
+    relieving=frozenset(fetch_df(f"SELECT DISTINCT relieving_staff_id AS sid {overlap} AND relieving_staff_id IS NOT NULL", (str(end), str(start)))["sid"].astype(int))
+
+    app_idx = rank_index_safe(applicant_rank)
+    cand=all_staff[~all_staff["id"].astype(int).isin(on_leave | relieving | {int(applicant_id)})]
+    if enforce_nearest and app_idx is not None:
+        # unknown ranks map to <NA> and count as distance 0, like before
+        dist=(rank_index_series(cand["rank"]) - app_idx).abs().fillna(0).astype(int)
+    else:
+        dist=pd.Series(0, index=cand.index)
+    pool=list(zip(cand["id"].astype(int).tolist(), cand["name"].tolist(), cand["rank"].tolist(), dist.tolist()))
+    return pool, on_leave, relieving
 
 def page_leave():
     st.markdown("<div class='worknest-header'><h2>🧳 Leave</h2></div>", unsafe_allow_html=True)
-    staff_df=fetch_df("SELECT id,name,rank FROM staff ORDER BY name")
-    hol_df=fetch_df("SELECT date FROM public_holidays")
-    holidays=[dtparser.parse(x).date() for x in hol_df["date"].tolist()] if not hol_df.empty else []
+    staff_df=fetch_df_cached("SELECT id,name,rank FROM staff ORDER BY name")
+    holidays=load_holidays()
 
     if staff_df.empty:
         st.info("Add staff first."); return
@@ -3200,10 +3657,10 @@ def page_leave():
             srow=staff_df[staff_df["id"]==int(sid)].iloc[0]
             st.write(f"Applicant: **{srow['name']}**")
         ltype=st.selectbox("Type", ["Annual","Casual","Sick","Maternity","Paternity","Other"], key="lv_type")
-        start=st.date_input("Start Date", value=(safe_parse_date(selected["start_date"], date.today()) if selected is not None else date.today()), key=f"proj_start{suffix}")
+        start=st.date_input("Start Date", value=date.today(), key="lv_start")
 
         yr=start.year
-        casual_taken_row=fetch_df("SELECT SUM(working_days) d FROM leaves WHERE staff_id=? AND leave_type='Casual' AND substr(start_date,1,4)=?",
+        casual_taken_row=fetch_df_cached("SELECT SUM(working_days) d FROM leaves WHERE staff_id=? AND leave_type='Casual' AND substr(start_date,1,4)=?",
                                   (int(srow["id"]), str(yr)))
         taken_so_far=int(casual_taken_row["d"].iloc[0]) if (not casual_taken_row.empty and pd.notna(casual_taken_row["d"].iloc[0])) else 0
         casual_remaining=max(0, 14-taken_so_far)
@@ -3237,49 +3694,11 @@ def page_leave():
         st.metric(label=f"{start.year} casual remaining", value=f"{casual_remaining} days")
 
     # --- Reliever enforcement (relaxed for future-year planning and unknown ranks) ---
-    all_staff=fetch_df("SELECT id,name,rank FROM staff ORDER BY name")
-    all_leaves=fetch_df("SELECT staff_id, relieving_staff_id, start_date, end_date, status FROM leaves")
-
-    def is_on_leave(sid, s, e):
-        if all_leaves.empty: return False
-        for _,L in all_leaves.iterrows():
-            if int(L["staff_id"])==int(sid):
-                try:
-                    Ls=dtparser.parse(L["start_date"]).date(); Le=dtparser.parse(L["end_date"]).date()
-                except: continue
-                if (s<=Le and Ls<=e) and (str(L.get("status","Pending"))!="Rejected"):
-                    return True
-        return False
-
-    def is_already_relieving(sid, s, e):
-        if all_leaves.empty: return False
-        for _,L in all_leaves.iterrows():
-            if pd.notna(L["relieving_staff_id"]) and int(L["relieving_staff_id"])==int(sid):
-                try:
-                    Ls=dtparser.parse(L["start_date"]).date(); Le=dtparser.parse(L["end_date"]).date()
-                except: continue
-                if (s<=Le and Ls<=e) and (str(L.get("status","Pending"))!="Rejected"):
-                    return True
-        return False
-
     planning_future_year = start.year > date.today().year
     enforce_nearest = not planning_future_year
 
-    app_idx = rank_index_safe(srow["rank"])
-    pool=[]
-    for _,cand in all_staff.iterrows():
-        if int(cand["id"])==int(srow["id"]): 
-            continue
-        if is_on_leave(int(cand["id"]), start, end): 
-            continue
-        if is_already_relieving(int(cand["id"]), start, end): 
-            continue
-        c_idx = rank_index_safe(cand["rank"])
-        if enforce_nearest and (app_idx is not None and c_idx is not None):
-            dist = abs(c_idx - app_idx)
-        else:
-            dist = 0
-        pool.append((int(cand["id"]), cand["name"], cand["rank"], dist))
+    pool, on_leave, relieving = reliever_pool(int(srow["id"]), srow["rank"], start, end, enforce_nearest)
+    pool_by_name={p[1]: p for p in reversed(pool)}  # first match wins on duplicate names
 
     if not pool:
         st.error("No available reliever found for the requested period. Adjust dates or add staff.")
@@ -3296,7 +3715,7 @@ def page_leave():
 
     non_nearest_selected = (not planning_future_year) and (reliever and (reliever not in nearest_names))
     if non_nearest_selected:
-        ch = [p for p in pool if p[1]==reliever][0]
+        ch = pool_by_name[reliever]
         chosen_rank = ch[2]; chosen_dist = ch[3]
         nearest_dist = min(p[3] for p in pool) if pool else None
         st.warning(f"Selected reliever **{reliever} ({chosen_rank})** is not nearest in rank (distance={chosen_dist}). "
@@ -3318,15 +3737,15 @@ def page_leave():
     if not reliever: can_submit=False; msg = msg or "No reliever selected."
     elif non_nearest_selected: can_submit=False; msg = msg or "You must select a nearest-in-rank reliever."
     else:
-        chosen = [p for p in pool if p[1]==reliever]
+        chosen = pool_by_name.get(reliever)
         if chosen:
-            ch_id = chosen[0][0]
-            if is_on_leave(ch_id, start, end): can_submit=False; msg="Relieving officer is on leave in the requested period."
-            if is_already_relieving(ch_id, start, end): can_submit=False; msg="Relieving officer is already assigned to relieve another staff in the requested period."
+            ch_id = chosen[0]
+            if ch_id in on_leave: can_submit=False; msg="Relieving officer is on leave in the requested period."
+            if ch_id in relieving: can_submit=False; msg="Relieving officer is already assigned to relieve another staff in the requested period."
 
     if st.button("📝 Submit Leave Application", key="lv_submit"):
         if can_submit:
-            reliever_id=int([p for p in pool if p[1]==reliever][0][0])
+            reliever_id=int(pool_by_name[reliever][0])
             execute("INSERT INTO leaves (staff_id,leave_type,start_date,end_date,working_days,relieving_staff_id,status,reason) VALUES (?,?,?,?,?,?,'Pending',?)",
                     (int(srow["id"]),ltype,str(start),str(end),int(wd),reliever_id,reason or None))
             st.success("Leave application submitted.")
@@ -3335,7 +3754,7 @@ def page_leave():
 
 def page_leave_table():
     st.markdown("<div class='worknest-header'><h2>📄 Leave Table</h2></div>", unsafe_allow_html=True)
-    df=fetch_df("""
+    df=fetch_df_cached("""
         SELECT L.id, S.name AS staff, S.rank, L.leave_type, L.start_date, L.end_date, L.working_days,
                R.name AS reliever, L.status, L.reason
         FROM leaves L
@@ -3351,7 +3770,7 @@ def page_leave_table():
     with c2:
         type_filter = st.selectbox("Filter by type", ["All"] + sorted(df["leave_type"].unique().tolist()), key="lvf2")
     with c3:
-        years = sorted({dtparser.parse(d).year for d in df["start_date"]})
+        years = sorted(df["start_date"].astype(str).str[:4].unique())
         year_filter = st.selectbox("Filter by year", ["All"] + [str(y) for y in years], key="lvf3")
     f = df.copy()
     if staff_filter!="All": f = f[f["staff"]==staff_filter]
@@ -3361,41 +3780,40 @@ def page_leave_table():
 
 # ---------- Tasks & Performance ----------
 def _build_expected_biweekly_windows(start_date:date, today:date)->list:
-    out=[]
-    if not isinstance(start_date, date): return out
-    cur=start_date
-    while cur + timedelta(days=14) <= today:
-        nxt=cur + timedelta(days=14)
-        out.append((cur, nxt))
-        cur=nxt
-    return out
+    if not isinstance(start_date, date): return []
+    # Every 14-day window [start, start+14] that has fully elapsed by today
+    starts=np.arange(start_date.toordinal(), today.toordinal()-13, 14)
+    return [(date.fromordinal(int(s)), date.fromordinal(int(s)+14)) for s in starts]
 
 def page_tasks():
     st.markdown("<div class='worknest-header'><h2>🗂️ Tasks & Performance</h2></div>", unsafe_allow_html=True)
 
     st.markdown("### ⏰ Reminders")
-    ass=fetch_df("""
+    # Day difference worked out by the database; today is passed in so the cached result rolls over at midnight.
+    days_to_due=("CAST(NULLIF(substr(t.due_date,1,10),'') AS DATE) - CAST(? AS DATE)" if DB_IS_POSTGRES
+                 else "CAST(julianday(substr(t.due_date,1,10)) - julianday(?) AS INTEGER)")
+    ass=fetch_df_cached(f"""
         SELECT
             ta.id AS assignment_id,
             t.title,
             s.name AS staff,
             COALESCE(p.code || ' — ' || p.name, p.code, '—') AS project,
             t.due_date,
-            ta.status
+            ta.status,
+            {days_to_due} AS days_to_due
         FROM task_assignments ta
         JOIN tasks t ON t.id=ta.task_id
         JOIN staff s ON s.id=ta.staff_id
         LEFT JOIN projects p ON p.id=t.project_id
         WHERE ta.status!='Completed'
         ORDER BY date(t.due_date) ASC
-    """)
+    """, (str(date.today()),))
     if ass.empty:
         st.caption("No open assignments, so no reminders.")
     else:
         ass["due_date"]=ass["due_date"].astype(str)
-        ass["days_to_due"]=ass["due_date"].apply(lambda d: (dtparser.parse(d).date()-date.today()).days if d else None)
-        due_soon=ass[(ass["days_to_due"].notna()) & (ass["days_to_due"]>=0) & (ass["days_to_due"]<=2)].copy()
-        overdue=ass[(ass["days_to_due"].notna()) & (ass["days_to_due"]<0)].copy()
+        due_soon=ass[ass["days_to_due"].between(0, 2)].copy()
+        overdue=ass[ass["days_to_due"]<0].copy()
 
         c1,c2=st.columns(2)
         with c1:
@@ -3415,10 +3833,13 @@ def page_tasks():
                     st.success(f"Checked {stats['checked']} assignments. Sent {stats['sent']} emails. Skipped {stats['skipped']}. Errors {stats['errors']}.")
                 else:
                     st.warning("SMTP is not configured, so no emails were sent. In-app reminders above still work.")
-    staff=fetch_df("SELECT id,name,section FROM staff ORDER BY name")
-    projects=fetch_df("SELECT id,code,name,start_date,next_due_date FROM projects ORDER BY code")
+    staff=fetch_df_cached("SELECT id,name,section FROM staff ORDER BY name")
+    staff_id_by_name=dict(zip(staff["name"][::-1], staff["id"][::-1]))  # first match wins on duplicate names
+    projects=fetch_df_cached("SELECT id,code,name,start_date,next_due_date FROM projects ORDER BY code")
+    project_id_by_code=dict(zip(projects["code"][::-1], projects["id"][::-1]))
+    project_label_by_id={int(i): f"{c} — {n}" for i, c, n in zip(projects["id"], projects["code"], projects["name"])}
     st.subheader("Tasks")
-    titles=fetch_df("SELECT id,title FROM tasks ORDER BY id DESC")
+    titles=fetch_df_cached("SELECT id,title FROM tasks ORDER BY id DESC")
     mode_options = ["Edit existing"] if not can_assign_tasks() else ["Create new","Edit existing"]
     mode=st.radio("Mode", mode_options, horizontal=True, key="tsk_mode")
 
@@ -3432,7 +3853,7 @@ def page_tasks():
         label_map={f"#{r['id']} — {r['title']}":int(r['id']) for _,r in titles.iterrows()}
         pick=st.selectbox("Select task", list(label_map.keys()), key="tsk_pick")
         tid=label_map[pick]
-        trow=fetch_df("SELECT * FROM tasks WHERE id=?", (tid,)).iloc[0]
+        trow=fetch_df_cached("SELECT id,title,description,date_assigned,due_date,project_id,created_by_staff_id FROM tasks WHERE id=?", (tid,)).iloc[0]
         task_dict = dict(trow)
         # Ensure widget keys vary by selected task so the form reflects the selected task immediately.
         tkey = f"_{int(tid)}"
@@ -3447,31 +3868,31 @@ def page_tasks():
         else:
             staff_allowed = staff.copy()
 
+        # Current assignees: the multiselect default below and the section-head check share this one read.
+        existing_ass = fetch_df_cached("SELECT s.name, s.section FROM task_assignments ta JOIN staff s ON s.id=ta.staff_id WHERE ta.task_id=?", (tid,))
         # If this task already includes assignees outside section, section head cannot edit it.
         if (not is_admin()) and user_role()=='section_head':
-            existing_ass = fetch_df("SELECT s.section FROM task_assignments ta JOIN staff s ON s.id=ta.staff_id WHERE ta.task_id=?", (tid,))
             if (not existing_ass.empty):
                 sec = current_staff_section() or ""
-                bad = existing_ass["section"].fillna("").str.strip().apply(lambda x: x!=sec).any()
+                bad = existing_ass["section"].fillna("").str.strip().ne(sec).any()
                 if bad:
                     can_edit = False
         title=st.text_input("Title", value=trow["title"], key=f"tsk_title{tkey}", disabled=not can_edit)
         desc=st.text_area("Description", value=trow["description"] or "", key=f"tsk_desc{tkey}", disabled=not can_edit)
-        date_assigned=st.date_input("Date assigned", value=dtparser.parse(trow["date_assigned"]).date(), key=f"tsk_da{tkey}", disabled=not can_edit)
-        due=st.date_input("Due date", value=dtparser.parse(trow["due_date"]).date(), key=f"tsk_due{tkey}", disabled=not can_edit)
+        date_assigned=st.date_input("Date assigned", value=parse_iso_date(trow["date_assigned"]), key=f"tsk_da{tkey}", disabled=not can_edit)
+        due=st.date_input("Due date", value=parse_iso_date(trow["due_date"]), key=f"tsk_due{tkey}", disabled=not can_edit)
         da=int(max((due - date_assigned).days + 1, 1))
         st.write(f"Days allotted (auto): **{da}**")
-        proj_opt=["—"]+[f"{r['code']} — {r['name']}" for _,r in projects.iterrows()]
+        proj_opt=["—"]+list(project_label_by_id.values())
         proj_value="—"
         if pd.notna(trow["project_id"]):
-            pr=projects[projects["id"]==int(trow["project_id"])]
-            if not pr.empty: proj_value=f"{pr['code'].iloc[0]} — {pr['name'].iloc[0]}"
+            proj_value=project_label_by_id.get(int(trow["project_id"]), "—")
         proj=st.selectbox("Project (optional)", proj_opt, index=proj_opt.index(proj_value) if proj_value in proj_opt else 0, key=f"tsk_proj{tkey}", disabled=not can_edit)
         assignees=st.multiselect(
             "Assignees",
             staff_allowed["name"].tolist(),
             key=f"tsk_asg{tkey}",
-            default=fetch_df("SELECT name FROM task_assignments ta JOIN staff s ON s.id=ta.staff_id WHERE ta.task_id=?", (tid,))["name"].tolist(),
+            default=existing_ass["name"].tolist(),
             disabled=not can_edit,
         )
         colA,colB,colC=st.columns(3)
@@ -3480,13 +3901,15 @@ def page_tasks():
                 if not can_edit:
                     st.warning("You don't have permission to edit this task.")
                 else:
-                    execute("UPDATE tasks SET title=?,description=?,date_assigned=?,days_allotted=?,due_date=?,project_id=? WHERE id=?",
-                        (title, desc or None, str(date_assigned), int(da), str(due),
-                         int(projects[projects['code']==proj.split(' — ')[0]]['id'].iloc[0]) if proj!="—" else None, tid))
-                    execute("DELETE FROM task_assignments WHERE task_id=?", (tid,))
-                    for nm in assignees:
-                        sid=int(staff[staff["name"]==nm]["id"].iloc[0])
-                        execute("INSERT INTO task_assignments (task_id,staff_id,status) VALUES (?,?,?)",(tid,sid,"In progress"))
+                    execute_transaction([
+                        ("UPDATE tasks SET title=?,description=?,date_assigned=?,days_allotted=?,due_date=?,project_id=? WHERE id=?",
+                         [(title, desc or None, str(date_assigned), int(da), str(due),
+                           int(project_id_by_code[proj.split(' — ')[0]]) if proj!="—" else None, tid)]),
+                        ("DELETE FROM task_assignments WHERE task_id=?", [(tid,)]),
+                        ("INSERT INTO task_assignments (task_id,staff_id,status) VALUES (?,?,?)",
+                         [(tid, int(staff_id_by_name[nm]), "In progress") for nm in assignees]),
+                    ])
+                    invalidate_alerts()
                     st.success("Task updated."); st.rerun()
         with colB:
             # Completion workflow: only Admin or permitted Section Heads can confirm completion.
@@ -3499,34 +3922,36 @@ def page_tasks():
                     # Section heads may only confirm tasks within their section
                     if (not is_admin()) and user_role()=='section_head':
                         sec = current_staff_section() or ""
-                        chk = fetch_df("""SELECT s.section FROM task_assignments ta
+                        chk = fetch_df_cached("""SELECT s.section FROM task_assignments ta
                                            JOIN staff s ON s.id=ta.staff_id
                                            WHERE ta.task_id=?""", (tid,))
-                        if (not chk.empty) and chk["section"].fillna("").str.strip().apply(lambda x: x!=sec).any():
+                        if (not chk.empty) and chk["section"].fillna("").str.strip().ne(sec).any():
                             st.error("You can only confirm completion for tasks assigned within your section.")
                             st.stop()
 
                     today_d=date.today()
                     today=str(today_d)
-                    da=_parse_date_safe(trow["date_assigned"]) or today_d
-                    ass=fetch_df("SELECT id, staff_id FROM task_assignments WHERE task_id=?", (tid,))
-                    for _,ar in ass.iterrows():
-                        days_taken=int((today_d - da).days)
-                        execute("UPDATE task_assignments SET status='Completed', completed_date=?, days_taken=? WHERE id=?",
-                                (today, days_taken, int(ar["id"])))
+                    da=pd.to_datetime(trow["date_assigned"], errors="coerce")
+                    da=da.date() if pd.notna(da) else today_d
+                    days_taken=int((today_d - da).days)
+                    awarded_at=datetime.now().isoformat(timespec="seconds")
+                    # Two set-based statements cover every assignee of the task.
+                    execute_transaction([
+                        ("UPDATE task_assignments SET status='Completed', completed_date=?, days_taken=? WHERE task_id=?",
+                         [(today, days_taken, tid)]),
                         # Legacy points table (kept for backward compatibility)
-                        try:
-                            execute("INSERT OR IGNORE INTO points (staff_id, source, source_id, points, awarded_at) VALUES (?,?,?,?,?)",
-                                    (int(ar["staff_id"]), "task", int(ar["id"]), 5, datetime.now().isoformat(timespec="seconds")))
-                        except Exception:
-                            pass
+                        ("INSERT OR IGNORE INTO points (staff_id, source, source_id, points, awarded_at) SELECT staff_id, 'task', id, 5, ? FROM task_assignments WHERE task_id=?",
+                         [(awarded_at, tid)]),
+                    ])
+                    invalidate_alerts()
                     st.success("Completion confirmed for all assignees."); st.rerun()
 
             # Delete remains Admin-only
             if is_admin():
                 if st.button("🗑️ Admin: Delete Task", key=f"tsk_del{tkey}"):
-                    execute("DELETE FROM task_assignments WHERE task_id=?", (tid,))
-                    execute("DELETE FROM tasks WHERE id=?", (tid,))
+                    execute_transaction([("DELETE FROM task_assignments WHERE task_id=?", [(tid,)]),
+                                         ("DELETE FROM tasks WHERE id=?", [(tid,)])])
+                    invalidate_alerts()
                     st.success("Task deleted."); st.rerun()
             else:
                 st.caption("Delete is Admin-only.")
@@ -3546,17 +3971,17 @@ def page_tasks():
             if not attach_files:
                 st.error("Select one or more files first.")
             else:
-                ok=0
-                for f in attach_files:
-                    path=save_uploaded_file(f, f"task_{tid}/attachments")
-                    if path:
-                        execute("""INSERT INTO task_documents (task_id,file_path,original_name,uploaded_at,uploader_staff_id)
-                                   VALUES (?,?,?,?,?)""",
-                                (int(tid), path, getattr(f, "name", None), datetime.now().isoformat(timespec="seconds"), current_staff_id()))
-                        ok += 1
-                st.success(f"Uploaded {ok} attachment(s)."); st.rerun()
+                # Disk writes release the GIL, so save the files in parallel, then record them in one executemany.
+                with ThreadPoolExecutor(max_workers=min(8, len(attach_files))) as ex:
+                    paths=list(ex.map(lambda f: save_uploaded_file(f, f"task_{tid}/attachments"), attach_files))
+                uploaded_at=datetime.now().isoformat(timespec="seconds")
+                doc_rows=[(int(tid), path, getattr(f, "name", None), uploaded_at, current_staff_id())
+                          for f, path in zip(attach_files, paths) if path]
+                execute_many("""INSERT INTO task_documents (task_id,file_path,original_name,uploaded_at,uploader_staff_id)
+                                VALUES (?,?,?,?,?)""", doc_rows)
+                st.success(f"Uploaded {len(doc_rows)} attachment(s)."); st.rerun()
     
-        adf=fetch_df("SELECT id, original_name, file_path, uploaded_at FROM task_documents WHERE task_id=? ORDER BY uploaded_at DESC",(int(tid),))
+        adf=fetch_df_cached("SELECT id, original_name, file_path, uploaded_at FROM task_documents WHERE task_id=? ORDER BY uploaded_at DESC",(int(tid),))
         if adf.empty:
             st.caption("No attachments yet.")
         else:
@@ -3592,16 +4017,16 @@ def page_tasks():
         due=st.date_input("Due date", value=date.today()+timedelta(days=7), key="tsk_due_new")
         da=int(max((due - date_assigned).days + 1, 1))
         st.write(f"Days allotted (auto): **{da}**")
-        proj_opt=["—"]+[f"{r['code']} — {r['name']}" for _,r in projects.iterrows()]
+        proj_opt=["—"]+list(project_label_by_id.values())
         proj=st.selectbox("Project (optional)", proj_opt, key="tsk_proj_new")
         assignees=st.multiselect("Assignees", staff_allowed_new["name"].tolist(), key="tsk_asg_new")
         if can_assign_tasks() and st.button("➕ Create Task", key="tsk_create"):
-            pid = int(projects[projects['code']==proj.split(' — ')[0]]['id'].iloc[0]) if proj!="—" else None
+            pid = int(project_id_by_code[proj.split(' — ')[0]]) if proj!="—" else None
             tid=execute("INSERT INTO tasks (title,description,date_assigned,days_allotted,due_date,project_id,created_by_staff_id) VALUES (?,?,?,?,?,?,?)",
                         (title, desc or None, str(date_assigned), int(da), str(due), pid, current_staff_id()))
-            for nm in assignees:
-                sid=int(staff[staff["name"]==nm]["id"].iloc[0])
-                execute("INSERT INTO task_assignments (task_id,staff_id,status) VALUES (?,?,?)",(tid,sid,"In progress"))
+            execute_many("INSERT INTO task_assignments (task_id,staff_id,status) VALUES (?,?,?)",
+                         [(tid, int(staff_id_by_name[nm]), "In progress") for nm in assignees])
+            invalidate_alerts()
             # Push notifications to assignees (best-effort)
             try:
                 if "email" in staff.columns:
@@ -3615,7 +4040,7 @@ def page_tasks():
             st.success("Task created."); st.rerun()
 
     st.subheader("Assignments")
-    df=fetch_df("""
+    df=fetch_df_cached("""
         SELECT
             ta.id,
             t.title,
@@ -3635,22 +4060,24 @@ def page_tasks():
     if df.empty:
         st.info("No assignments yet.")
     else:
-        df["overdue"]=df.apply(lambda r: (r["status"]!="Completed") and (date.today()>dtparser.parse(r["due_date"]).date()), axis=1)
-        def score_row(r):
-            if r["status"]!="Completed" or pd.isna(r["completed_date"]):
-                return 0
-            due=dtparser.parse(r["due_date"]).date()
-            cd=dtparser.parse(r["completed_date"]).date()
-            late=max((cd-due).days, 0)
-            return max(0, 100 - 5*late)
-        df["score"]=df.apply(score_row, axis=1)
-        st.dataframe(df[["project","title","staff","due_date","status","completed_date","days_allotted","overdue","score"]], width='stretch')
+        # Arrow-native dtypes for the table: repeated labels as categories, dates as datetime64 (reused below).
+        for c in ("status", "project", "staff"):
+            df[c]=df[c].astype("category")
+        for c in ("due_date", "completed_date", "date_assigned"):
+            df[c]=pd.to_datetime(df[c].astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+        due, comp = df["due_date"], df["completed_date"]
+        done=df["status"].eq("Completed")
+        df["overdue"]=~done & (due < pd.Timestamp(date.today()))
+        late=(comp - due).dt.days.clip(lower=0)
+        df["score"]=(100 - 5*late).clip(lower=0).where(done & comp.notna(), 0).fillna(0).astype(int)
+        st.dataframe(df[["project","title","staff","due_date","status","completed_date","days_allotted","overdue","score"]], width='stretch',
+                     column_config={c: st.column_config.DateColumn(format="YYYY-MM-DD") for c in ("due_date", "completed_date")})
 
     st.divider()
     st.subheader("📊 Cumulative Performance Scoreboard")
     st.caption("Scores are aggregated directly from the points ledger (single source of truth).")
 
-    perf = fetch_df("""
+    perf = fetch_df_cached("""
         SELECT
             s.id,
             s.name,
@@ -3809,16 +4236,7 @@ def page_admin_inbox():
                         st.rerun()
                 with c4:
                     if file_path and os.path.exists(file_path):
-                        try:
-                            with open(file_path, "rb") as f:
-                                st.download_button(
-                                    "⬇️ Download",
-                                    f,
-                                    file_name=os.path.basename(file_path),
-                                    key=f"inbox_{kind}_dl_{rid}",
-                                )
-                        except Exception:
-                            st.caption("Download unavailable.")
+                        file_download_button("⬇️ Download", file_path, key=f"inbox_{kind}_dl_{rid}")
 
     with tab_reports:
         df = fetch_df(
@@ -3879,6 +4297,21 @@ def page_import():
         if df is not None:
             created_users=0
             updated_users=0
+            # Resolve every row against in-memory maps, then write in a couple of batched transactions
+            # instead of 3-4 queries per CSV row. Rows queued for insert are matched by later rows just
+            # like rows already in the table, so duplicates within the file still merge.
+            def _first(*keys):
+                # the SQL lookups returned the lowest id; queued rows ("new", n) sort after real ids
+                keys=[k for k in keys if k is not None]
+                return min(keys, key=lambda k: (1, k[1]) if isinstance(k, tuple) else (0, k)) if keys else None
+
+            staff_now=fetch_df("SELECT id,name,email FROM staff ORDER BY id")
+            max_staff_id=int(staff_now["id"].max()) if not staff_now.empty else 0
+            s_by_email, s_by_name = {}, {}
+            for s_id, s_nm, s_em in zip(staff_now["id"], staff_now["name"], staff_now["email"]):
+                if s_em is not None and pd.notna(s_em): s_by_email.setdefault(str(s_em), int(s_id))
+                s_by_name.setdefault(str(s_nm).lower(), int(s_id))
+            new_staff, staff_updates, row_users = [], [], []
             for _,r in df.iterrows():
                 if pd.isna(r.get("name")) or pd.isna(r.get("rank")): 
                     continue
@@ -3886,19 +4319,18 @@ def page_import():
                 email = r.get("email") if pd.notna(r.get("email")) and str(r.get("email")).strip() else None
                 email = str(email).strip().lower() if email else None
 
-                ex = fetch_df("SELECT id FROM staff WHERE (email IS NOT NULL AND email=? ) OR LOWER(name)=LOWER(?)", (email, name))
-                if ex.empty:
-                    execute("""INSERT INTO staff (name,rank,email,phone,section,role,grade,join_date)
-                               VALUES (?,?,?,?,?,?,?,?)""",
-                            (name, r.get("rank"), email, r.get("phone"), r.get("section"), r.get("role"), r.get("grade"), r.get("join_date")))
-                    ex = fetch_df("SELECT id FROM staff WHERE (email IS NOT NULL AND email=? ) OR LOWER(name)=LOWER(?)", (email, name))
+                vals = [r.get("rank"), email, r.get("phone"), r.get("section"), r.get("role"), r.get("grade"), r.get("join_date")]
+                staff_key = _first(s_by_email.get(email) if email else None, s_by_name.get(name.lower()))
+                if staff_key is None:
+                    staff_key = ("new", len(new_staff))
+                    new_staff.append([name] + vals)
+                elif isinstance(staff_key, tuple):
+                    row = new_staff[staff_key[1]]
+                    row[1:] = [vals[0], email or row[2]] + vals[2:]
                 else:
-                    execute("""UPDATE staff SET rank=?, email=COALESCE(?,email), phone=?, section=?, role=?, grade=?, join_date=? WHERE id=?""",
-                            (r.get("rank"), email, r.get("phone"), r.get("section"), r.get("role"), r.get("grade"), r.get("join_date"), int(ex["id"].iloc[0])))
-
-                if ex.empty:
-                    continue
-                staff_id=int(ex["id"].iloc[0])
+                    staff_updates.append(tuple(vals) + (staff_key,))
+                if email: s_by_email[email] = _first(s_by_email.get(email), staff_key)
+                s_by_name.setdefault(name.lower(), staff_key)
 
                 # --- Ensure there is a login account for every staff ---
                 # username priority: email (preferred) else name
@@ -3915,37 +4347,72 @@ def page_import():
                 else:
                     role_norm = "staff"
 
-                uex = fetch_df("SELECT id, password_hash FROM users WHERE staff_id=? OR LOWER(username)=LOWER(?)", (staff_id, uname))
-                if uex.empty:
+                row_users.append((staff_key, uname, is_admin_flag, role_norm))
+
+            execute_transaction([
+                ("""INSERT INTO staff (name,rank,email,phone,section,role,grade,join_date) VALUES (?,?,?,?,?,?,?,?)""", new_staff),
+                ("""UPDATE staff SET rank=?, email=COALESCE(?,email), phone=?, section=?, role=?, grade=?, join_date=? WHERE id=?""", staff_updates),
+            ])
+            # Newly inserted staff have distinct names (a shared name would have merged them), so map them back by name.
+            fresh=fetch_df("SELECT id,name FROM staff WHERE id>? ORDER BY id", (max_staff_id,))
+            fresh_by_name={}
+            for s_id, s_nm in zip(fresh["id"], fresh["name"]): fresh_by_name.setdefault(str(s_nm).lower(), int(s_id))
+            new_staff_ids=[fresh_by_name.get(str(row[0]).lower()) for row in new_staff]
+
+            users_now=fetch_df("SELECT id, staff_id, username, password_hash FROM users ORDER BY id")
+            u_by_staff, u_by_name, u_pw = {}, {}, {}
+            for u_id, u_sid, u_nm, u_pwh in zip(users_now["id"], users_now["staff_id"], users_now["username"], users_now["password_hash"]):
+                if pd.notna(u_sid): u_by_staff.setdefault(int(u_sid), int(u_id))
+                u_by_name.setdefault(str(u_nm).lower(), int(u_id))
+                u_pw[int(u_id)] = u_pwh
+            default_pw = hash_pwd("fcda")  # hashed once per import: it is the published default and must be changed at first login
+            new_users, pw_resets, relinks = [], [], []
+            for staff_key, uname, is_admin_flag, role_norm in row_users:
+                staff_id = new_staff_ids[staff_key[1]] if isinstance(staff_key, tuple) else staff_key
+                if staff_id is None:
+                    continue
+                user_key = _first(u_by_staff.get(staff_id), u_by_name.get(str(uname).lower()))
+                if user_key is None:
                     # Default password is fcda; force change on first login
-                    try:
-                        execute("""INSERT INTO users (staff_id,username,password_hash,is_admin,role,is_active,must_change_password)
-                                   VALUES (?,?,?,?,?,?,?)""",
-                                (staff_id, uname, hash_pwd("fcda"), is_admin_flag, role_norm, 1, 1))
-                    except Exception:
-                        # Backward compatibility if column doesn't exist yet
-                        execute("""INSERT INTO users (staff_id,username,password_hash,is_admin,role,is_active)
-                                   VALUES (?,?,?,?,?,?)""",
-                                (staff_id, uname, hash_pwd("fcda"), is_admin_flag, role_norm, 1))
+                    user_key = ("new", len(new_users))
+                    new_users.append([staff_id, uname, default_pw, is_admin_flag, role_norm, 1, 1])
                     created_users += 1
+                elif isinstance(user_key, tuple):
+                    new_users[user_key[1]][0:2] = [staff_id, uname]
+                    new_users[user_key[1]][3:5] = [is_admin_flag, role_norm]
+                    updated_users += 1
                 else:
                     # Keep existing password unless it's blank; update username/role linkage
-                    pw = uex["password_hash"].iloc[0]
+                    pw = u_pw.get(user_key)
                     if pw is None or str(pw).strip()=="":
-                        pw = hash_pwd("fcda")
-                        try:
-                            execute("""UPDATE users SET staff_id=?, username=?, password_hash=?, is_admin=?, role=?, is_active=1, must_change_password=1 WHERE id=?""",
-                                    (staff_id, uname, pw, is_admin_flag, role_norm, int(uex["id"].iloc[0])))
-                        except Exception:
-                            execute("""UPDATE users SET staff_id=?, username=?, password_hash=?, is_admin=?, role=?, is_active=1 WHERE id=?""",
-                                    (staff_id, uname, pw, is_admin_flag, role_norm, int(uex["id"].iloc[0])))
+                        pw_resets.append((staff_id, uname, default_pw, is_admin_flag, role_norm, user_key))
+                        u_pw[user_key] = default_pw
                     else:
-                        try:
-                            execute("""UPDATE users SET staff_id=?, username=?, is_admin=?, role=?, is_active=1 WHERE id=?""",
-                                    (staff_id, uname, is_admin_flag, role_norm, int(uex["id"].iloc[0])))
-                        except Exception:
-                            pass
+                        relinks.append((staff_id, uname, is_admin_flag, role_norm, user_key))
                     updated_users += 1
+                u_by_staff[staff_id] = _first(u_by_staff.get(staff_id), user_key)
+                u_by_name[str(uname).lower()] = _first(u_by_name.get(str(uname).lower()), user_key)
+            try:
+                execute_transaction([
+                    ("""INSERT INTO users (staff_id,username,password_hash,is_admin,role,is_active,must_change_password) VALUES (?,?,?,?,?,?,?)""", new_users),
+                    ("""UPDATE users SET staff_id=?, username=?, password_hash=?, is_admin=?, role=?, is_active=1, must_change_password=1 WHERE id=?""", pw_resets),
+                ])
+            except Exception as e:
+                if "must_change_password" not in str(e).lower():
+                    raise
+                # Backward compatibility if must_change_password doesn't exist yet
+                execute_transaction([
+                    ("""INSERT INTO users (staff_id,username,password_hash,is_admin,role,is_active) VALUES (?,?,?,?,?,?)""", [u[:6] for u in new_users]),
+                    ("""UPDATE users SET staff_id=?, username=?, password_hash=?, is_admin=?, role=?, is_active=1 WHERE id=?""", pw_resets),
+                ])
+            relink_q = """UPDATE users SET staff_id=?, username=?, is_admin=?, role=?, is_active=1 WHERE id=?"""
+            try:
+                execute_many(relink_q, relinks)
+            except Exception:
+                # A username already held by another account: skip just that relink, as before
+                for row in relinks:
+                    try: execute(relink_q, row)
+                    except Exception: pass
 
             st.success(f"Staff imported/updated. Users created: {created_users}, users updated: {updated_users}.")
         else:
@@ -3961,8 +4428,7 @@ def page_import():
             st.error("nigeria_public_holidays_2025_2026.csv not found. Upload it above or place it in data/.");
             df=None
         if df is not None:
-            for _,r in df.iterrows():
-                execute("INSERT INTO public_holidays (date,name) VALUES (?,?)", (str(r["date"]), r.get("name")))
+            execute_many("INSERT INTO public_holidays (date,name) VALUES (?,?)", [(str(r["date"]), r.get("name")) for _,r in df.iterrows()])
             st.success("Public holidays imported.")
         else:
             st.error("data/nigeria_public_holidays_2025_2026.csv not found.")
@@ -3978,16 +4444,22 @@ def page_import():
             df=None
         if df is not None:
             staff_df=fetch_df("SELECT id,name,email FROM staff")
+            sup_by_email, sup_by_name = {}, {}
+            for s_id, s_nm, s_em in zip(staff_df["id"], staff_df["name"], staff_df["email"]):
+                if isinstance(s_em, str): sup_by_email.setdefault(s_em.lower(), int(s_id))
+                sup_by_name.setdefault(s_nm, int(s_id))
             def staff_id_from(row):
                 sup_email = row.get("supervisor_email") if isinstance(row.get("supervisor_email"), str) else None
                 sup_name  = row.get("supervisor") if isinstance(row.get("supervisor"), str) else None
-                if sup_email and not staff_df.empty:
-                    m = staff_df[staff_df["email"].str.lower()==sup_email.lower()]
-                    if not m.empty: return int(m["id"].iloc[0])
-                if sup_name and not staff_df.empty:
-                    m = staff_df[staff_df["name"]==sup_name]
-                    if not m.empty: return int(m["id"].iloc[0])
+                if sup_email and sup_email.lower() in sup_by_email: return sup_by_email[sup_email.lower()]
+                if sup_name and sup_name in sup_by_name: return sup_by_name[sup_name]
                 return None
+            # code -> id for existing projects; new codes are queued (a repeated code keeps its last row, as the
+            # old insert-then-update did) and everything is written in one transaction.
+            proj_now=fetch_df("SELECT id,code FROM projects ORDER BY id")
+            proj_ids={}
+            for p_id, p_code in zip(proj_now["id"], proj_now["code"]): proj_ids.setdefault(str(p_code), int(p_id))
+            new_projects, project_updates = {}, []
             for _,r in df.iterrows():
                 code = r.get("code") or r.get("project_code")
                 name = r.get("name") or r.get("project_name")
@@ -3995,22 +4467,27 @@ def page_import():
                 location = r.get("location")
                 sd = r.get("start_date"); ed = r.get("end_date")
                 try:
-                    if pd.notna(sd): sd = dtparser.parse(str(sd)).date().isoformat()
+                    if pd.notna(sd): sd = parse_iso_date(sd).isoformat()
                 except: sd = None
                 try:
-                    if pd.notna(ed): ed = dtparser.parse(str(ed)).date().isoformat()
+                    if pd.notna(ed): ed = parse_iso_date(ed).isoformat()
                 except: ed = None
                 sup_id = staff_id_from(r)
                 rs = r.get("rebar_strength"); cs = r.get("concrete_strength")
                 smin = r.get("target_slump_min"); smax = r.get("target_slump_max")
                 if pd.isna(code) or pd.isna(name): continue
-                ex=fetch_df("SELECT id FROM projects WHERE code=?", (code,))
-                if ex.empty:
-                    execute("""INSERT INTO projects (code,name,client,location,rebar_strength,concrete_strength,target_slump_min,target_slump_max,supervisor_staff_id,start_date,end_date)
-                               VALUES (?,?,?,?,?,?,?,?,?,?,?)""", (code,name,client,location,rs,cs,smin,smax,sup_id,sd,ed))
+                if str(code) in proj_ids:
+                    project_updates.append((name,client,location,rs,cs,smin,smax,sup_id,sd,ed,proj_ids[str(code)]))
+                elif str(code) in new_projects:
+                    new_projects[str(code)] = (new_projects[str(code)][0],name,client,location,rs,cs,smin,smax,sup_id,sd,ed)
                 else:
-                    execute("""UPDATE projects SET name=?, client=?, location=?, rebar_strength=?, concrete_strength=?, target_slump_min=?, target_slump_max=?, supervisor_staff_id=?, start_date=?, end_date=? WHERE id=?""",
-                            (name,client,location,rs,cs,smin,smax,sup_id,sd,ed,int(ex["id"].iloc[0])))
+                    new_projects[str(code)] = (code,name,client,location,rs,cs,smin,smax,sup_id,sd,ed)
+            execute_transaction([
+                ("""INSERT INTO projects (code,name,client,location,rebar_strength,concrete_strength,target_slump_min,target_slump_max,supervisor_staff_id,start_date,end_date)
+                    VALUES (?,?,?,?,?,?,?,?,?,?,?)""", list(new_projects.values())),
+                ("""UPDATE projects SET name=?, client=?, location=?, rebar_strength=?, concrete_strength=?, target_slump_min=?, target_slump_max=?, supervisor_staff_id=?, start_date=?, end_date=? WHERE id=?""",
+                 project_updates),
+            ])
             st.success("Projects imported/updated.")
         else:
             st.error("data/structural_project_info_min.csv not found.")
@@ -4021,28 +4498,37 @@ def page_import():
             df=pd.read_csv(path)
             staff_df=fetch_df("SELECT id,name,email FROM staff")
             proj_df=fetch_df("SELECT id,code FROM projects")
+            pid_by_code, sid_by_email, sid_by_name = {}, {}, {}
+            for p_id, p_code in zip(proj_df["id"], proj_df["code"]): pid_by_code.setdefault(p_code, int(p_id))
+            for s_id, s_nm, s_em in zip(staff_df["id"], staff_df["name"], staff_df["email"]):
+                if isinstance(s_em, str): sid_by_email.setdefault(s_em.lower(), int(s_id))
+                sid_by_name.setdefault(s_nm, int(s_id))
+            posting_ids={}
+            for ps_id, ps_pid, ps_sid in fetch_df("SELECT id, project_id, staff_id FROM project_staff ORDER BY id DESC").itertuples(index=False):
+                posting_ids[(int(ps_pid), int(ps_sid))] = int(ps_id)
+            new_postings, posting_updates = {}, []
             for _,r in df.iterrows():
                 pcode = r.get("project_code") or r.get("code")
                 role = r.get("role") if pd.notna(r.get("role")) else None
                 staff_email = r.get("staff_email") if isinstance(r.get("staff_email"), str) else None
                 staff_name = r.get("staff_name") if isinstance(r.get("staff_name"), str) else None
                 if pd.isna(pcode): continue
-                pr = proj_df[proj_df["code"]==pcode]
-                if pr.empty: continue
-                pid=int(pr["id"].iloc[0])
+                if pcode not in pid_by_code: continue
+                pid=pid_by_code[pcode]
                 sid=None
                 if staff_email:
-                    m=staff_df[staff_df["email"].str.lower()==staff_email.lower()]
-                    if not m.empty: sid=int(m["id"].iloc[0])
+                    sid=sid_by_email.get(staff_email.lower())
                 if sid is None and staff_name:
-                    m=staff_df[staff_df["name"]==staff_name]
-                    if not m.empty: sid=int(m["id"].iloc[0])
+                    sid=sid_by_name.get(staff_name)
                 if sid is None: continue
-                ex=fetch_df("SELECT id FROM project_staff WHERE project_id=? AND staff_id=?", (pid,sid))
-                if ex.empty:
-                    execute("INSERT INTO project_staff (project_id,staff_id,role) VALUES (?,?,?)", (pid,sid,role))
+                if (pid,sid) in posting_ids:
+                    posting_updates.append((role, posting_ids[(pid,sid)]))
                 else:
-                    execute("UPDATE project_staff SET role=? WHERE id=?", (role, int(ex["id"].iloc[0])))
+                    new_postings[(pid,sid)] = role  # a repeated posting keeps its last role
+            execute_transaction([
+                ("INSERT INTO project_staff (project_id,staff_id,role) VALUES (?,?,?)", [(p_, s_, r_) for (p_, s_), r_ in new_postings.items()]),
+                ("UPDATE project_staff SET role=? WHERE id=?", posting_updates),
+            ])
             st.success("Project postings imported/updated.")
         else:
             st.error("data/postings.csv not found.")
@@ -4157,8 +4643,8 @@ def page_account():
         return
 
     uid = int(u["id"])
-    urec = fetch_df("SELECT id, username, role, is_admin, must_change_password FROM users WHERE id=?", (uid,))
-    must = 0 if urec.empty else int(urec.iloc[0].get("must_change_password") or 0)
+    urec = fetch_one_dict("SELECT id, username, role, is_admin, must_change_password FROM users WHERE id=?", (uid,))
+    must = int(urec.get("must_change_password") or 0)
 
     # Prefer email as external id for OneSignal targeting
     external_id = (u.get("email") or u.get("username") or str(uid)).strip()
@@ -4182,8 +4668,8 @@ def page_account():
             elif new1 != new2:
                 st.error("Passwords do not match.")
             else:
-                row = fetch_df("SELECT password_hash FROM users WHERE id=?", (uid,))
-                if row.empty or (hash_pwd(old) != str(row.iloc[0]["password_hash"])):
+                row = fetch_one_dict("SELECT password_hash FROM users WHERE id=?", (uid,))
+                if not row or not verify_pwd(old, row["password_hash"]):
                     st.error("Current password is incorrect.")
                 else:
                     execute_sql(
@@ -4264,8 +4750,8 @@ def page_account():
         elif new1 != new2:
             st.error("Passwords do not match.")
         else:
-            row = fetch_df("SELECT password_hash FROM users WHERE id=?", (uid,))
-            if row.empty or (hash_pwd(old) != str(row.iloc[0]["password_hash"])):
+            row = fetch_one_dict("SELECT password_hash FROM users WHERE id=?", (uid,))
+            if not row or not verify_pwd(old, row["password_hash"]):
                 st.error("Current password is incorrect.")
             else:
                 execute_sql(
@@ -4322,8 +4808,29 @@ def _models_dir()->str:
         pass
     return d
 
+@st.cache_resource(show_spinner=False)
+def _sklearn():
+    # scikit-learn/joblib are optional and slow to import; only the ML page needs them, so load on first use.
+    try:
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import OneHotEncoder
+        from sklearn.compose import ColumnTransformer
+        from sklearn.pipeline import Pipeline
+        from sklearn.metrics import accuracy_score, roc_auc_score, mean_absolute_error
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.ensemble import RandomForestRegressor
+        import joblib
+    except Exception:
+        return None
+    return SimpleNamespace(
+        train_test_split=train_test_split, OneHotEncoder=OneHotEncoder, ColumnTransformer=ColumnTransformer,
+        Pipeline=Pipeline, accuracy_score=accuracy_score, roc_auc_score=roc_auc_score,
+        mean_absolute_error=mean_absolute_error, LogisticRegression=LogisticRegression,
+        RandomForestRegressor=RandomForestRegressor, joblib=joblib,
+    )
+
 def _ml_enabled()->bool:
-    return (Pipeline is not None) and (joblib is not None)
+    return _sklearn() is not None
 
 def _ml_fetch_training_df()->pd.DataFrame:
     """
@@ -4357,51 +4864,25 @@ def _ml_fetch_training_df()->pd.DataFrame:
     if df.empty:
         return df
     # Feature engineering
-    def _safe_len(x):
-        try: return len(str(x or "").strip())
-        except Exception: return 0
-
     df["days_allotted"] = pd.to_numeric(df.get("days_allotted"), errors="coerce").fillna(0).astype(int)
-    df["title_len"] = df["title"].apply(_safe_len)
+    df["title_len"] = df["title"].fillna("").astype(str).str.strip().str.len()
     df["staff_section"] = df["staff_section"].fillna("unknown").astype(str)
-    df["staff_rank"] = df["staff_rank"].fillna("unknown").astype(str)
-
-    # Labels
-    def _parse_dt(x):
-        try:
-            if x is None or (isinstance(x,float) and pd.isna(x)): return None
-            s=str(x).strip()
-            if s=="" or s.lower() in ("nan","none","null"): return None
-            return dtparser.parse(s)
-        except Exception:
-            return None
-
-    due = df["due_date"].apply(_parse_dt)
-    comp = df["completed_date"].apply(_parse_dt)
-
-    overdue = []
-    days_taken = []
-    for i in range(len(df)):
-        d = due.iloc[i]
-        c = comp.iloc[i]
-        if c is None or d is None:
-            overdue.append(np.nan)
-        else:
-            overdue.append(1 if c.date() > d.date() else 0)
-        # duration label (only when completed)
-        if c is None:
-            days_taken.append(np.nan)
-        else:
-            a = _parse_dt(df.iloc[i].get("date_assigned"))
-            if a is None:
-                days_taken.append(np.nan)
-            else:
-                days_taken.append(max((c.date()-a.date()).days, 0))
-    df["label_overdue"] = overdue
-    df["label_days_taken"] = days_taken
+    df["staff_rank"] = normalize_rank_series(df["staff_rank"].fillna("unknown"))
+
+    # Labels (dates are stored ISO: parse whole columns with a fixed format; missing/junk -> NaT -> NaN label)
+    def _dates(col):
+        return pd.to_datetime(df[col].astype(str).str[:10], format="%Y-%m-%d", errors="coerce")
+
+    due = _dates("due_date")
+    comp = _dates("completed_date")
+    assigned = _dates("date_assigned")
+    df["label_overdue"] = (comp > due).astype(float).where(comp.notna() & due.notna())
+    # duration label (only when completed)
+    df["label_days_taken"] = (comp - assigned).dt.days.clip(lower=0)
     return df
 
 def _ml_train_overdue_model(df:pd.DataFrame):
+    sk = _sklearn()
     d = df.dropna(subset=["label_overdue"]).copy()
     if d.empty:
         return None, {}
@@ -4409,25 +4890,25 @@ def _ml_train_overdue_model(df:pd.DataFrame):
     y = d["label_overdue"].astype(int)
     cat = ["staff_section","staff_rank"]
     num = ["days_allotted","title_len"]
-    pre = ColumnTransformer(
+    pre = sk.ColumnTransformer(
         transformers=[
-            ("cat", OneHotEncoder(handle_unknown="ignore"), cat),
+            ("cat", sk.OneHotEncoder(handle_unknown="ignore"), cat),
             ("num", "passthrough", num),
         ]
     )
-    model = LogisticRegression(max_iter=1000)
-    pipe = Pipeline(steps=[("pre", pre), ("model", model)])
+    model = sk.LogisticRegression(max_iter=1000)
+    pipe = sk.Pipeline(steps=[("pre", pre), ("model", model)])
     # Train/test split if possible
     metrics={}
     try:
-        Xtr,Xte,ytr,yte = train_test_split(X,y,test_size=0.25,random_state=42,stratify=y if y.nunique()>1 else None)
+        Xtr,Xte,ytr,yte = sk.train_test_split(X,y,test_size=0.25,random_state=42,stratify=y if y.nunique()>1 else None)
         pipe.fit(Xtr,ytr)
         yp = pipe.predict(Xte)
-        metrics["accuracy"] = float(accuracy_score(yte, yp))
+        metrics["accuracy"] = float(sk.accuracy_score(yte, yp))
         try:
             if hasattr(pipe, "predict_proba") and y.nunique()>1:
                 pr = pipe.predict_proba(Xte)[:,1]
-                metrics["auc"] = float(roc_auc_score(yte, pr))
+                metrics["auc"] = float(sk.roc_auc_score(yte, pr))
         except Exception:
             pass
     except Exception:
@@ -4435,6 +4916,7 @@ def _ml_train_overdue_model(df:pd.DataFrame):
     return pipe, metrics
 
 def _ml_train_duration_model(df:pd.DataFrame):
+    sk = _sklearn()
     d = df.dropna(subset=["label_days_taken"]).copy()
     if d.empty:
         return None, {}
@@ -4442,20 +4924,20 @@ def _ml_train_duration_model(df:pd.DataFrame):
     y = pd.to_numeric(d["label_days_taken"], errors="coerce").fillna(0.0)
     cat = ["staff_section","staff_rank"]
     num = ["days_allotted","title_len"]
-    pre = ColumnTransformer(
+    pre = sk.ColumnTransformer(
         transformers=[
-            ("cat", OneHotEncoder(handle_unknown="ignore"), cat),
+            ("cat", sk.OneHotEncoder(handle_unknown="ignore"), cat),
             ("num", "passthrough", num),
         ]
     )
-    model = RandomForestRegressor(n_estimators=200, random_state=42)
-    pipe = Pipeline(steps=[("pre", pre), ("model", model)])
+    model = sk.RandomForestRegressor(n_estimators=200, random_state=42)
+    pipe = sk.Pipeline(steps=[("pre", pre), ("model", model)])
     metrics={}
     try:
-        Xtr,Xte,ytr,yte = train_test_split(X,y,test_size=0.25,random_state=42)
+        Xtr,Xte,ytr,yte = sk.train_test_split(X,y,test_size=0.25,random_state=42)
         pipe.fit(Xtr,ytr)
         pred = pipe.predict(Xte)
-        metrics["mae"] = float(mean_absolute_error(yte, pred))
+        metrics["mae"] = float(sk.mean_absolute_error(yte, pred))
     except Exception:
         pipe.fit(X,y)
     return pipe, metrics
@@ -4482,8 +4964,9 @@ def _ml_log_prediction(model_name:str, task_id:int|None, assignment_id:int|None,
 def _ml_load(model_name:str):
     try:
         path = os.path.join(_models_dir(), f"{model_name}.joblib")
-        if os.path.exists(path) and joblib is not None:
-            return joblib.load(path)
+        sk = _sklearn()
+        if os.path.exists(path) and sk is not None:
+            return sk.joblib.load(path)
     except Exception:
         pass
     return None
@@ -4510,7 +4993,7 @@ def page_ml():
                 st.warning("Not enough labeled data to train overdue model.")
             else:
                 path = os.path.join(_models_dir(), "overdue_risk_v0.joblib")
-                joblib.dump(pipe, path)
+                _sklearn().joblib.dump(pipe, path)
                 _ml_save_run("overdue_risk_v0", pipe, metrics, path, len(df))
                 st.success(f"Trained and saved: {path}")
                 st.json(metrics)
@@ -4521,13 +5004,13 @@ def page_ml():
                 st.warning("Not enough completed tasks to train duration model.")
             else:
                 path = os.path.join(_models_dir(), "duration_v0.joblib")
-                joblib.dump(pipe, path)
+                _sklearn().joblib.dump(pipe, path)
                 _ml_save_run("duration_v0", pipe, metrics, path, len(df))
                 st.success(f"Trained and saved: {path}")
                 st.json(metrics)
 
 def main():
-    init_db(); apply_styles()
+    _init_db_once(); apply_styles()
     # Restore login from remember-token cookie (if present)
     try_auto_login_from_cookie()
     if not current_user():
@@ -1,9 +1,12 @@
-import os, smtplib, ssl
+import os, re, smtplib, ssl
+import atexit, threading
 import math
+from functools import lru_cache
 from datetime import date, timedelta
 from email.message import EmailMessage
 from dateutil import parser as dtparser
 import pandas as pd
+import numpy as np
 
 try:
     import psycopg2
@@ -13,23 +16,47 @@ except Exception:
 import sqlite3
 
 DB_URL = os.getenv("DATABASE_URL") or os.getenv("WORKNEST_DB_URL") or ""
-DB_IS_POSTGRES = bool(DB_URL.strip().lower().startswith(("postgres://","postgresql://")))
+# Accept SQLAlchemy-style driver suffixes (postgresql+psycopg://) like the app does.
+DB_URL = re.sub(r"^(postgres(?:ql)?)\+\w+://", r"\1://", DB_URL.strip(), flags=re.I)
+DB_IS_POSTGRES = bool(DB_URL.lower().startswith(("postgres://","postgresql://")))
 DB_PATH = os.getenv("WORKNEST_DB_PATH","worknest.db")
 
+@lru_cache(maxsize=512)
 def _adapt_query(q: str) -> str:
     if DB_IS_POSTGRES:
         return q.replace("?", "%s")
     return q
 
+_local = threading.local()
+
 def get_conn():
+    # One connection per thread for the whole run: a worker pass issues hundreds of small queries,
+    # and reconnecting for each one (PRAGMAs on SQLite, TLS + auth on Postgres) dominated the run time.
+    c=getattr(_local, "conn", None)
+    if c is not None and not (DB_IS_POSTGRES and c.closed):
+        return c
     if DB_IS_POSTGRES:
         if not psycopg2:
             raise RuntimeError("psycopg2 not installed. Add psycopg2-binary.")
-        return psycopg2.connect(DB_URL)
-    c=sqlite3.connect(DB_PATH, check_same_thread=False)
-    c.execute("PRAGMA foreign_keys=ON")
+        c=psycopg2.connect(DB_URL)
+    else:
+        c=sqlite3.connect(DB_PATH, check_same_thread=False)
+        # Same tuning as the app: WAL so the worker's writes don't block the UI's readers, and wait out
+        # a busy writer instead of failing with "database is locked".
+        for pragma in ("journal_mode=WAL", "synchronous=NORMAL", "temp_store=MEMORY", "busy_timeout=5000", "foreign_keys=ON"):
+            c.execute(f"PRAGMA {pragma}")
+    _local.conn=c
     return c
 
+def close_conn():
+    c=getattr(_local, "conn", None)
+    _local.conn=None
+    if c is not None:
+        try: c.close()
+        except Exception: pass
+
+atexit.register(close_conn)
+
 def fetch_df(q, p=()):
     q=_adapt_query(q)
     c=get_conn()
@@ -37,8 +64,10 @@ def fetch_df(q, p=()):
         df=pd.read_sql_query(q, c, params=p)
         return df
     finally:
-        try: c.close()
-        except Exception: pass
+        # The connection is kept: end the read transaction so Postgres doesn't sit "idle in transaction".
+        if DB_IS_POSTGRES:
+            try: c.rollback()
+            except Exception: pass
 
 def execute(q, p=()):
     q=_adapt_query(q).strip()
@@ -49,18 +78,40 @@ def execute(q, p=()):
         if " on conflict" not in q.lower():
             q = q.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
     c=get_conn()
-    try:
-        if DB_IS_POSTGRES:
-            with c:
-                with c.cursor() as cur:
-                    cur.execute(q, p)
-        else:
-            cur=c.cursor()
-            cur.execute(q, p)
+    if DB_IS_POSTGRES:
+        with c:
+            with c.cursor() as cur:
+                cur.execute(q, p)
+    else:
+        try:
+            c.execute(q, p)
             c.commit()
-    finally:
-        try: c.close()
-        except Exception: pass
+        except Exception:
+            c.rollback()
+            raise
+
+
+def execute_many(q, rows):
+    rows=[tuple(r) for r in rows]
+    if not rows:
+        return
+    q=_adapt_query(q).strip()
+    if DB_IS_POSTGRES and q.lower().startswith("insert or ignore"):
+        q = "INSERT" + q[len("INSERT OR IGNORE"):]
+        if " on conflict" not in q.lower():
+            q = q.rstrip().rstrip(";") + " ON CONFLICT DO NOTHING"
+    c=get_conn()
+    if DB_IS_POSTGRES:
+        with c:
+            with c.cursor() as cur:
+                cur.executemany(q, rows)
+    else:
+        try:
+            c.executemany(q, rows)
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
 
 
 def _get_setting(key:str, default:str="") -> str:
@@ -73,6 +124,27 @@ def _get_setting(key:str, default:str="") -> str:
         pass
     return default
 
+def _parse_date(v) -> date:
+    # Stored dates are ISO text; dateutil only for legacy spellings.
+    s=str(v).strip()
+    try:
+        return date.fromisoformat(s[:10])
+    except ValueError:
+        return dtparser.parse(s).date()
+
+def _date_series(s):
+    # Column version of _parse_date: one fixed-format ISO pass, the rest through the scalar parser; unparseable -> NaT.
+    # The worker can't rely on the app's ISO normalisation having run on this database.
+    s=s.astype(str).str.strip()
+    out=pd.to_datetime(s.str[:10], format="%Y-%m-%d", errors="coerce")
+    rest=out.isna() & ~s.str.lower().isin(("", "nan", "none", "null", "nat"))
+    if rest.any():
+        def _safe(v):
+            try: return _parse_date(v)
+            except Exception: return None
+        out[rest]=pd.to_datetime(s[rest].map(_safe), errors="coerce")
+    return out
+
 def _month_start(d:date) -> date:
     return date(d.year, d.month, 1)
 
@@ -128,8 +200,8 @@ def run_staff_of_month_post(today:date|None=None)->dict:
 
         def task_points(da, allotted, cd):
             try:
-                da=dtparser.parse(str(da)).date()
-                cd=dtparser.parse(str(cd)).date()
+                da=_parse_date(da)
+                cd=_parse_date(cd)
                 allotted=int(allotted or 0)
                 if allotted<=0: return 0
                 days=(cd-da).days+1
@@ -139,6 +211,7 @@ def run_staff_of_month_post(today:date|None=None)->dict:
             except Exception:
                 return 0
 
+        perf_rows=[]
         for _,sr in staff.iterrows():
             sid=int(sr['id'])
             srows=tdf[tdf['staff_id']==sid] if not tdf.empty else pd.DataFrame()
@@ -146,17 +219,18 @@ def run_staff_of_month_post(today:date|None=None)->dict:
             # Reports are skipped in worker for simplicity; the app UI can compute/refresh monthly.
             rp=0
             tsp=testmap.get(sid,0)*3
-            # Upsert (requires unique constraint)
-            if DB_IS_POSTGRES:
-                execute("""INSERT INTO performance_index (staff_id, month, task_points, report_points, test_points)
-                           VALUES (?,?,?,?,?)
-                           ON CONFLICT (staff_id, month) DO UPDATE
-                           SET task_points=EXCLUDED.task_points,
-                               report_points=EXCLUDED.report_points,
-                               test_points=EXCLUDED.test_points""", (sid, mstr, int(tp), int(rp), int(tsp)))
-            else:
-                execute("INSERT OR REPLACE INTO performance_index (staff_id, month, task_points, report_points, test_points) VALUES (?,?,?,?,?)",
-                        (sid, mstr, int(tp), int(rp), int(tsp)))
+            perf_rows.append((sid, mstr, int(tp), int(rp), int(tsp)))
+        # Upsert (requires unique constraint); one executemany so the statement is prepared once for all staff
+        if DB_IS_POSTGRES:
+            execute_many("""INSERT INTO performance_index (staff_id, month, task_points, report_points, test_points)
+                            VALUES (?,?,?,?,?)
+                            ON CONFLICT (staff_id, month) DO UPDATE
+                            SET task_points=EXCLUDED.task_points,
+                                report_points=EXCLUDED.report_points,
+                                test_points=EXCLUDED.test_points""", perf_rows)
+        else:
+            execute_many("INSERT OR REPLACE INTO performance_index (staff_id, month, task_points, report_points, test_points) VALUES (?,?,?,?,?)",
+                         perf_rows)
     except Exception:
         # If this fails, still try to post based on existing performance_index
         pass
@@ -261,62 +335,73 @@ def run_task_reminders(today:date|None=None, horizon_days:int=2)->dict:
     if df.empty:
         return {"checked":0,"sent":0,"skipped":0,"errors":0}
 
-    sent=skipped=errors=0
-    for _,r in df.iterrows():
-        try:
-            due=dtparser.parse(r["due_date"]).date()
-        except Exception:
-            continue
-        days_to_due=(due - today).days
-        if days_to_due < 0:
-            rtype="overdue"
-        elif days_to_due <= horizon_days:
-            rtype="due_soon"
-        else:
-            continue
+    done=fetch_df("SELECT assignment_id, reminder_type FROM reminders_sent WHERE sent_on=?", (today_s,))
+    sent_today=set(zip(map(int, done["assignment_id"]), done["reminder_type"]))
+    sent_rows=[]
 
-        already=fetch_df("SELECT 1 FROM reminders_sent WHERE assignment_id=? AND reminder_type=? AND sent_on=?",
-                         (int(r["assignment_id"]), rtype, today_s))
-        if not already.empty:
-            continue
-
-        proj=""
-        if pd.notna(r.get("project_code")) and pd.notna(r.get("project_name")):
-            proj=f"{r['project_code']} — {r['project_name']}"
-        elif pd.notna(r.get("project_code")):
-            proj=str(r["project_code"])
-
-        subj=f"WorkNest: Task reminder ({'OVERDUE' if rtype=='overdue' else 'Due soon'}) — {r['title']}"
-        body_lines=[
-            f"Hello {r['staff_name']},",
-            "",
-            "This is an automated reminder from WorkNest.",
-            "",
-            f"Task: {r['title']}",
-            f"Due date: {due.isoformat()}",
-        ]
-        if proj:
-            body_lines.append(f"Project: {proj}")
-        if rtype=="overdue":
-            body_lines.append(f"Status: OVERDUE by {abs(days_to_due)} day(s)")
-        else:
-            body_lines.append(f"Status: Due in {days_to_due} day(s)")
-        body_lines += ["", "Please log into WorkNest to review the task details and attachments.", "", "— WorkNest"]
-
-        ok,msg=send_email(str(r.get("staff_email") or "").strip(), subj, "\n".join(body_lines))
-        if ok:
-            sent += 1
-            execute("INSERT OR IGNORE INTO reminders_sent (assignment_id, reminder_type, sent_on) VALUES (?,?,?)",
-                    (int(r["assignment_id"]), rtype, today_s))
-        else:
-            if msg in ["missing recipient", "SMTP not configured"]:
-                skipped += 1
+    due_ts=_date_series(df["due_date"])
+    days=(due_ts - pd.Timestamp(today)).dt.days
+    todo=df.assign(
+        due=due_ts.dt.date,
+        days_to_due=days,
+        rtype=np.select([days < 0, days <= horizon_days], ["overdue", "due_soon"], default=""),
+    )
+    todo=todo[due_ts.notna() & (todo["rtype"]!="")]
+
+    sent=skipped=errors=0
+    try:
+        for _,r in todo.iterrows():
+            due, days_to_due, rtype = r["due"], int(r["days_to_due"]), r["rtype"]
+            if (int(r["assignment_id"]), rtype) in sent_today:
+                continue
+
+            proj=""
+            if pd.notna(r.get("project_code")) and pd.notna(r.get("project_name")):
+                proj=f"{r['project_code']} — {r['project_name']}"
+            elif pd.notna(r.get("project_code")):
+                proj=str(r["project_code"])
+
+            subj=f"WorkNest: Task reminder ({'OVERDUE' if rtype=='overdue' else 'Due soon'}) — {r['title']}"
+            body_lines=[
+                f"Hello {r['staff_name']},",
+                "",
+                "This is an automated reminder from WorkNest.",
+                "",
+                f"Task: {r['title']}",
+                f"Due date: {due.isoformat()}",
+            ]
+            if proj:
+                body_lines.append(f"Project: {proj}")
+            if rtype=="overdue":
+                body_lines.append(f"Status: OVERDUE by {abs(days_to_due)} day(s)")
             else:
-                errors += 1
+                body_lines.append(f"Status: Due in {days_to_due} day(s)")
+            body_lines += ["", "Please log into WorkNest to review the task details and attachments.", "", "— WorkNest"]
 
+            ok,msg=send_email(str(r.get("staff_email") or "").strip(), subj, "\n".join(body_lines))
+            if ok:
+                sent += 1
+                sent_rows.append((int(r["assignment_id"]), rtype, today_s))
+            else:
+                if msg in ["missing recipient", "SMTP not configured"]:
+                    skipped += 1
+                else:
+                    errors += 1
+    finally:
+        # Record what already went out even if a later send or row blows up, so the next run doesn't resend it
+        execute_many("INSERT OR IGNORE INTO reminders_sent (assignment_id, reminder_type, sent_on) VALUES (?,?,?)", sent_rows)
     return {"checked":int(len(df)),"sent":sent,"skipped":skipped,"errors":errors}
 
+def refresh_user_alerts():
+    # Periodic catch-up for the app's user_alerts materialized view (Postgres only);
+    # the app also refreshes it on task writes.
+    if not DB_IS_POSTGRES:
+        return
+    try: execute("REFRESH MATERIALIZED VIEW CONCURRENTLY user_alerts")
+    except Exception: pass
+
 if __name__=="__main__":
+    refresh_user_alerts()
     stats=run_task_reminders()
     som=run_staff_of_month_post()
     print({"reminders":stats, "staff_of_month":som})